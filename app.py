@@ -1,4 +1,4 @@
-from flask import Flask, request, send_file, jsonify, send_from_directory
+from flask import Flask, request, send_file, jsonify, send_from_directory, Response
 import os
 import shutil
 import sys
@@ -10,7 +10,7 @@ import re
 from docx2pdf import convert  # 导入 python-docx2pdf
 import pythoncom
 sys.path.append('.')
-from modules.pdf_image_processor import process_pdf  # PDF转图片再转文字处理
+from modules.pdf_image_processor import process_pdf, create_page_index  # PDF转图片再转文字处理
 from werkzeug.utils import secure_filename
 from modules.document_interpretation import get_file_extractor, process_single_document_with_name
 import time
@@ -175,19 +175,22 @@ def upload_files():
     # 初始化进度为0/0
     ip_states[client_ip]['progress']['current'] = 0
     ip_states[client_ip]['progress']['total'] = 0
+    ip_states[client_ip]['progress']['dedup'] = {'checked': 0, 'duplicates': 0}
     ip_states[client_ip]['total_files'] = len(files)
     ip_states[client_ip]['processed_files'] = 0
+    # 同一次上传的多个PDF共享重复页索引，跨文件的重复页面（如相同的封面、模板页）只分析一次
+    page_index = create_page_index()
 
     for file in files:
         if not allowed_file(file.filename):
             return jsonify({'error': f'不支持的文件类型: {file.filename}'}), 400
         file_path = os.path.join(temp_dir, file.filename)
         file.save(file_path)
-        Thread(target=process_pdf_with_cancel_check, args=(client_ip, file_path, output_dir)).start()
+        Thread(target=process_pdf_with_cancel_check, args=(client_ip, file_path, output_dir, page_index)).start()
 
     return jsonify({'message': '文件上传成功，开始处理', 'total_files': len(files)}), 200
 
-def process_pdf_with_cancel_check(ip, pdf_path, temp_output_dir):
+def process_pdf_with_cancel_check(ip, pdf_path, temp_output_dir, page_index=None):
     pythoncom.CoInitialize()  # 初始化COM库
     try:
         _, _, persistent_output_dir = get_user_dirs(ip, 'pdf_parse')
@@ -202,7 +205,7 @@ def process_pdf_with_cancel_check(ip, pdf_path, temp_output_dir):
         
         while not ip_states[ip]['is_canceling']:
             # 传递进度字典给 process_pdf
-            results = process_pdf(pdf_path, temp_output_dir, ip_states[ip]['progress'])
+            results = process_pdf(pdf_path, temp_output_dir, ip_states[ip]['progress'], page_index=page_index)
             if not ip_states[ip]['is_canceling']:
                 # 解析成功后将当前文件的相关文件从临时文件夹移动到持久文件夹
                 move_files_to_persistent(temp_output_dir, persistent_output_dir, base_name)
@@ -310,7 +313,8 @@ def get_detailed_progress():
             'currentFile': progress.get('currentFile', ''),
             'currentPage': progress.get('current', 0),
             'totalPages': progress.get('total', 0),
-            'status': progress.get('status', '等待处理')
+            'status': progress.get('status', '等待处理'),
+            'dedup': progress.get('dedup', {'checked': 0, 'duplicates': 0})
         })
     return jsonify({
         'currentFile': '',
@@ -525,8 +529,8 @@ def backup_file_to_user_folder(source_file_path, user_ip, original_filename=None
         print(f"备份文件失败: {str(e)}")
         return False, str(e)
 
-def process_single_file(file_path, output_dir, original_filename=None, user_ip=None):
-    """处理单个文件的函数"""
+def process_single_file(file_path, output_dir, original_filename=None, user_ip=None, on_token=None, reasoning='auto'):
+    """处理单个文件的函数，on_token 用于实时推送解读输出，reasoning 为请求指定的思考设置"""
     try:
         print(f"开始处理文件: {file_path}")
         
@@ -557,7 +561,8 @@ def process_single_file(file_path, output_dir, original_filename=None, user_ip=N
                 return False, "处理已取消"
         
         # 使用新的处理函数，传递原始文件名
-        success, message = process_single_document_with_name(file_path, output_dir, original_filename)
+        success, message = process_single_document_with_name(file_path, output_dir, original_filename, on_token=on_token,
+                                                             reasoning=reasoning)
         
         # 再次检查是否已取消（只有在有有效user_ip时才检查）
         if user_ip != 'default_user' and user_ip in pdf_reader_ip_states:
@@ -611,8 +616,15 @@ def upload_for_reading():
                 'status': '开始处理'
             }
             
-            # 启动异步处理，传递原始文件名和用户IP
-            thread = threading.Thread(target=process_file_async, args=(file_path, original_filename, user_ip))
+            # 在处理线程启动前创建输出流，上传返回后客户端即可订阅；处理线程只写入并关闭自己的这个输出流
+            stream = InterpretationStream()
+            pdf_reader_streams[user_ip] = stream
+            
+            # 可选的思考设置：auto（按文档长度和类型自动选择）、off、on 或思考预算token数
+            reasoning = request.form.get('reasoning', 'auto')
+            
+            # 启动异步处理，传递原始文件名、用户IP和思考设置
+            thread = threading.Thread(target=process_file_async, args=(file_path, original_filename, user_ip, reasoning, stream))
             thread.daemon = True  # 设置为守护线程
             thread.start()
             
@@ -628,6 +640,74 @@ def upload_for_reading():
 # 为每个IP保存PDF文档解读的处理状态
 pdf_reader_ip_states = {}
 
+class InterpretationStream:
+    """保存一次解读任务的流式输出事件，支持多个订阅者和断线后按事件ID续传"""
+    
+    def __init__(self):
+        self.events = []
+        self.closed = False
+        self._cond = threading.Condition()
+    
+    def publish(self, kind, text):
+        with self._cond:
+            self.events.append((kind, {'text': text}))
+            self._cond.notify_all()
+    
+    def close(self, status):
+        with self._cond:
+            self.events.append(('done', {'status': status}))
+            self.closed = True
+            self._cond.notify_all()
+    
+    def iter_events(self, start=0, keepalive=15):
+        """从第 start 个事件开始产出 (事件ID, 类型, 数据)，没有新事件时每隔 keepalive 秒产出一次None"""
+        index = start
+        while True:
+            with self._cond:
+                if index >= len(self.events) and not self.closed:
+                    self._cond.wait(timeout=keepalive)
+                events = self.events[index:]
+                closed = self.closed
+            if not events:
+                if closed:
+                    return
+                yield None
+                continue
+            for event in events:
+                yield (index,) + event
+                index += 1
+
+# 为每个IP保存最近一次解读任务的流式输出
+pdf_reader_streams = {}
+
+@app.route('/api/pdf-reader/stream', methods=['GET'])
+def stream_pdf_reader_output():
+    """以SSE推送文档解读的实时输出（事件类型：thinking、answer、reset、done）"""
+    user_ip = get_real_ip()
+    stream = pdf_reader_streams.get(user_ip)
+    if stream is None:
+        return jsonify({'error': '没有正在进行的解读任务'}), 404
+    
+    # EventSource断线重连时带上最后收到的事件ID，从下一个事件继续推送
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+    
+    def generate():
+        for event in stream.iter_events(start):
+            if event is None:
+                # 注释行用于保持连接，避免被代理超时断开
+                yield ": keepalive\n\n"
+                continue
+            event_id, kind, data = event
+            yield f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 @app.route('/api/pdf-reader/progress', methods=['GET'])
 def get_pdf_reader_progress():
     """获取文件处理进度"""
@@ -692,7 +772,7 @@ def cancel_pdf_reader_processing():
         logging.error(f"取消处理失败: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def process_file_async(file_path, original_filename, user_ip):
+def process_file_async(file_path, original_filename, user_ip, reasoning='auto', stream=None):
     """异步处理文件"""
     try:
         print(f"异步处理开始: {file_path} (原始文件名: {original_filename})")
@@ -726,8 +806,9 @@ def process_file_async(file_path, original_filename, user_ip):
             })
             return
         
-        # 调用实际的PDF处理函数，传递原始文件名、输出目录和用户IP
-        success, message = process_single_file(file_path, output_dir, original_filename, user_ip)
+        # 调用实际的PDF处理函数，传递原始文件名、输出目录和用户IP，解读输出实时写入本任务的输出流
+        success, message = process_single_file(file_path, output_dir, original_filename, user_ip,
+                                               stream.publish if stream is not None else None, reasoning)
         
         # 再次检查是否已取消
         if pdf_reader_ip_states[user_ip].get('cancel_flag', False):
@@ -778,6 +859,10 @@ def process_file_async(file_path, original_filename, user_ip):
         })
         print(f"异步处理出错: {str(e)}")
     finally:
+        # 结束本任务的输出流，订阅者收到done事件后断开；取消后重新上传时，旧任务不会关闭新任务的输出流
+        if stream is not None and not stream.closed:
+            stream.close(pdf_reader_ip_states.get(user_ip, {}).get('status', ''))
+        
         # 清理临时文件
         try:
             if os.path.exists(file_path):
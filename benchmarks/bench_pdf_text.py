@@ -0,0 +1,95 @@
+"""
+PDF文本提取后端基准测试
+比较 PDF_TEXT_BACKENDS 中各后端的提取速度（页/秒），并以pdfplumber的结果为基准计算词语重合度，
+用于确定 PDF_TEXT_BACKEND 与 PDF_TABLE_MIN_PATHS 的取值。
+
+用法：
+    # 使用自己的文档（可传入文件或目录）
+    python benchmarks/bench_pdf_text.py 文档目录/ 报告.pdf --output result.json
+    # 不传入文档时生成合成PDF（纯文字、带表格、文字与扫描混合）
+    python benchmarks/bench_pdf_text.py --pages 50
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.document_interpretation import PDF_TEXT_BACKENDS, iter_pdf_units, resolve_pdf_backend
+from benchmarks.synthetic_pdf import make_synthetic_pdf
+
+def collect_pdfs(paths):
+    """展开传入的文件和目录，返回其中的PDF文件列表"""
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                pdfs.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith('.pdf'))
+        elif path.lower().endswith('.pdf'):
+            pdfs.append(path)
+    return pdfs
+
+def word_overlap(text, reference):
+    """两段文本的词语多重集合重合度（交集/并集）"""
+    words, reference_words = Counter(text.split()), Counter(reference.split())
+    union = sum((words | reference_words).values())
+    return round(sum((words & reference_words).values()) / union, 4) if union else 1.0
+
+def bench_backend(pdf_path, backend):
+    """用指定后端串行提取整本PDF，返回耗时、吞吐量与提取结果"""
+    start = time.perf_counter()
+    units = list(iter_pdf_units(pdf_path, workers=1, backend=backend))
+    elapsed = time.perf_counter() - start
+    text = ''.join(unit['text'] for unit in units)
+    return {
+        "backend": backend,
+        "pages": len(units),
+        "chars": len(text),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(units) / elapsed, 2) if elapsed else None,
+    }, text
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF文本提取后端对比测试")
+    parser.add_argument("paths", nargs="*", help="用于测试的PDF文件或目录，不传入时使用合成PDF")
+    parser.add_argument("--backends", nargs="+", default=list(PDF_TEXT_BACKENDS), choices=list(PDF_TEXT_BACKENDS))
+    parser.add_argument("--pages", type=int, default=50, help="合成PDF的页数")
+    parser.add_argument("--output", help="结果JSON的保存路径")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdfs = collect_pdfs(args.paths)
+        if not args.paths:
+            pdfs = [
+                make_synthetic_pdf(os.path.join(work_dir, f"{kind}.pdf"), kind, args.pages)
+                for kind in ('text', 'table', 'mixed')
+            ]
+
+        files = []
+        for pdf_path in pdfs:
+            runs, texts = [], {}
+            for backend in args.backends:
+                if resolve_pdf_backend(backend) != backend:
+                    runs.append({"backend": backend, "skipped": "pypdfium2未安装"})
+                    continue
+                run, texts[backend] = bench_backend(pdf_path, backend)
+                runs.append(run)
+            reference = texts.get('pdfplumber')
+            for run in runs:
+                if reference is not None and run["backend"] in texts:
+                    run["word_overlap_vs_pdfplumber"] = word_overlap(texts[run["backend"]], reference)
+                    baseline = next(r for r in runs if r["backend"] == 'pdfplumber')["seconds"]
+                    run["speedup_vs_pdfplumber"] = round(baseline / run["seconds"], 2) if run["seconds"] else None
+            files.append({"pdf": os.path.basename(pdf_path), "runs": runs})
+
+    report = {"files": files}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
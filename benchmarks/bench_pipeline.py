@@ -0,0 +1,147 @@
+"""
+PDF处理流水线分阶段基准测试
+在合成PDF（纯文字/扫描/混合，10~500页）上分别计时 process_pdf 的各个阶段：
+- rasterize: pdf_to_images 使用的分窗口渲染
+- encode: 页面JPEG编码与Base64编码
+- model_call: 通过本地OpenAI兼容服务桩（可配置延迟）调用 analyze_image_with_model
+- json_to_docx: 生成Word文档
+每个阶段报告页/秒和阶段结束时的进程峰值内存，结果以JSON输出便于多次运行对比。
+
+用法：
+    python benchmarks/bench_pipeline.py --kinds text scanned mixed --pages 10 100 500 --latency 0.5 --output result.json
+"""
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+import platform
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.synthetic_pdf import make_synthetic_pdf
+from benchmarks.stub_server import start_stub_server
+from modules import inference_client, rate_limiter
+from modules import pdf_image_processor as processor
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def stage_result(seconds, pages):
+    return {
+        'seconds': round(seconds, 3),
+        'pages_per_sec': round(pages / seconds, 2) if seconds else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def bench_case(kind, page_count, work_dir, concurrency):
+    """对一份合成PDF逐阶段计时"""
+    pdf_path = make_synthetic_pdf(os.path.join(work_dir, f"{kind}_{page_count}.pdf"), kind, page_count)
+    payload_options = processor.get_payload_options()
+    stages = {}
+
+    # 渲染与编码：逐页交替进行，分别累计耗时
+    render_seconds = encode_seconds = 0.0
+    payloads = []
+    pages = processor.iter_pdf_pages(pdf_path, page_count=page_count)
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        render_seconds += time.perf_counter() - start
+        if page is None:
+            break
+        _, image = page
+        start = time.perf_counter()
+        payload = processor.encode_page(image, **payload_options)
+        base64.b64encode(payload)
+        encode_seconds += time.perf_counter() - start
+        image.close()
+        payloads.append(payload)
+    stages['rasterize'] = stage_result(render_seconds, page_count)
+    stages['encode'] = stage_result(encode_seconds, page_count)
+
+    # 模型调用：与 process_pdf 相同的并发度
+    client = inference_client.get_client()
+    mime_type = processor.PAYLOAD_MIME_TYPES[payload_options['image_format']]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        contents = list(executor.map(
+            lambda payload: processor.analyze_image_with_model(client, payload, mime_type=mime_type), payloads))
+    stages['model_call'] = stage_result(time.perf_counter() - start, page_count)
+
+    # Word导出
+    output_dir = os.path.join(work_dir, f"{kind}_{page_count}_output")
+    images_dir = os.path.join(output_dir, 'images')
+    os.makedirs(images_dir, exist_ok=True)
+    results = []
+    for page_num, (payload, content) in enumerate(zip(payloads, contents), 1):
+        image_name = processor.page_image_name(pdf_path, page_num, payload_options['image_format'])
+        with open(os.path.join(images_dir, image_name), 'wb') as f:
+            f.write(payload)
+        results.append(processor.make_page_result(page_num, image_name, os.path.basename(pdf_path), content=content))
+    start = time.perf_counter()
+    processor.json_to_docx(results, output_dir, os.path.basename(pdf_path))
+    stages['json_to_docx'] = stage_result(time.perf_counter() - start, page_count)
+
+    return {
+        'kind': kind,
+        'pages': page_count,
+        'pdf_bytes': os.path.getsize(pdf_path),
+        'payload_bytes': sum(len(payload) for payload in payloads),
+        'stages': stages,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF处理流水线分阶段基准测试")
+    parser.add_argument("--kinds", nargs="+", default=['text', 'scanned', 'mixed'], choices=['text', 'scanned', 'mixed'])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--latency", type=float, default=0.5, help="服务桩每次请求的延迟（秒）")
+    parser.add_argument("--concurrency", type=int, default=processor.MAX_CONCURRENT_PAGES, help="模型调用并发数")
+    parser.add_argument("--rps", type=float, default=None, help="覆盖限流器的每秒请求数（默认使用模块配置）")
+    parser.add_argument("--output", help="结果JSON输出路径（默认输出到标准输出）")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.latency)
+    inference_client.INFERENCE_BASE_URL = base_url
+    if args.rps:
+        rate_limiter.REQUESTS_PER_SECOND = args.rps
+        rate_limiter.BURST_SIZE = max(rate_limiter.BURST_SIZE, int(args.rps))
+
+    work_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    try:
+        cases = [bench_case(kind, pages, work_dir, args.concurrency) for kind in args.kinds for pages in args.pages]
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'latency': args.latency,
+            'concurrency': args.concurrency,
+            'render_window_size': processor.RENDER_WINDOW_SIZE,
+            'payload': processor.get_payload_options(),
+        },
+        'cases': cases,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
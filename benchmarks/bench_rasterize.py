@@ -0,0 +1,54 @@
+"""
+PDF栅格化基准测试
+比较不同渲染进程数下 iter_pdf_pages 的吞吐量（页/秒），用于确定 RENDER_WORKERS 的取值。
+
+用法：
+    python benchmarks/bench_rasterize.py 文档.pdf --workers 1 2 4 8 16 32 --window 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.pdf_image_processor import get_pdf_page_count, iter_pdf_pages, RENDER_WINDOW_SIZE
+
+def bench_rasterize(pdf_path, render_workers, window_size):
+    """渲染整本PDF（只在内存中保留当前窗口），返回耗时与吞吐量"""
+    page_count = get_pdf_page_count(pdf_path)
+    start = time.perf_counter()
+    rendered = 0
+    for _, image in iter_pdf_pages(pdf_path, None, window_size, page_count, render_workers):
+        image.close()
+        rendered += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "render_workers": render_workers,
+        "window_size": window_size,
+        "pages": rendered,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(rendered / elapsed, 2) if elapsed else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF栅格化多进程扩展性测试")
+    parser.add_argument("pdf_path", help="用于测试的PDF文件")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1],
+                        help="依次测试的渲染进程数")
+    parser.add_argument("--window", type=int, default=RENDER_WINDOW_SIZE, help="每个渲染窗口的页数")
+    args = parser.parse_args()
+
+    runs = [bench_rasterize(args.pdf_path, workers, args.window) for workers in args.workers]
+    baseline = runs[0]["pages_per_sec"] or 0
+    for run in runs:
+        run["speedup"] = round(run["pages_per_sec"] / baseline, 2) if baseline else None
+
+    print(json.dumps({
+        "pdf": os.path.basename(args.pdf_path),
+        "cpu_count": os.cpu_count(),
+        "runs": runs,
+    }, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+本地OpenAI兼容推理服务桩
+只实现 /v1/chat/completions（含流式响应），按配置的延迟返回固定内容，
+用于在不访问真实推理服务的情况下测量客户端侧的处理开销。
+"""
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+STUB_REPLY = "这是推理服务桩返回的页面描述。\n\n| 列1 | 列2 |\n| --- | --- |\n| a | b |"
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.5
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(self.latency)
+        if body.get('stream'):
+            self._send_stream(body)
+        else:
+            self._send_json({
+                'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': body.get('model', ''),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': STUB_REPLY}, 'finish_reason': 'stop'}],
+            })
+
+    def _send_json(self, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        events = [
+            {'id': 'stub', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': body.get('model', ''),
+             'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}
+            for token in STUB_REPLY.split(' ')
+        ]
+        for event in [json.dumps(event, ensure_ascii=False) for event in events] + ['[DONE]']:
+            data = f"data: {event}\n\n".encode('utf-8')
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+def start_stub_server(latency=0.5, port=0):
+    """在后台线程启动推理服务桩，返回 (server, base_url)"""
+    handler = type('StubHandler', (_StubHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1/"
@@ -0,0 +1,108 @@
+"""
+合成测试PDF生成器
+不依赖第三方PDF库，直接写出PDF对象，生成三类文档：
+- text: 纯文字页（Helvetica文字层，可被pdfplumber直接提取）
+- scanned: 扫描页（整页灰度JPEG图片，没有文字层）
+- mixed: 文字页与扫描页交替
+- table: 上半页文字、下半页带框线表格的页面（文字层中含表格线）
+"""
+import io
+import random
+from PIL import Image, ImageDraw
+
+PAGE_WIDTH = 595  # A4，单位pt
+PAGE_HEIGHT = 842
+SCAN_SIZE = (1240, 1754)  # A4 @ 150 DPI
+
+WORDS = ("revenue model latency throughput document interpretation table summary quarter growth "
+         "inference cache pipeline market analysis report section figure appendix").split()
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def _text_lines(rng, page_num, count=45):
+    lines = [f"Page {page_num} - synthetic benchmark document"]
+    for _ in range(count):
+        lines.append(' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 14))))
+    return lines
+
+def _text_page_stream(rng, page_num):
+    lines = ' '.join(f"({_escape(line)}) '" for line in _text_lines(rng, page_num))
+    return f"BT /F1 10 Tf 50 800 Td 16 TL {lines} ET".encode('latin-1')
+
+def _table_page_stream(rng, page_num, rows=12, cols=5):
+    lines = ' '.join(f"({_escape(line)}) '" for line in _text_lines(rng, page_num, count=20))
+    parts = [f"BT /F1 10 Tf 50 800 Td 16 TL {lines} ET", "0.5 w"]
+    cell_width, cell_height, left, top = 99, 24, 50, 440
+    for row in range(rows):
+        for col in range(cols):
+            x, y = left + col * cell_width, top - row * cell_height
+            text = rng.choice(WORDS) if row == 0 else f"{rng.randint(0, 99999)}"
+            parts.append(f"{x} {y - cell_height} {cell_width} {cell_height} re S")
+            parts.append(f"BT /F1 9 Tf {x + 4} {y - 16} Td ({_escape(text)}) Tj ET")
+    return ' '.join(parts).encode('latin-1')
+
+def _scanned_page_jpeg(rng, page_num):
+    image = Image.new('L', SCAN_SIZE, 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(_text_lines(rng, page_num, count=60)):
+        draw.text((80, 60 + i * 27), line, fill=rng.randint(0, 60))
+    # 加入少量噪点，模拟扫描件
+    for _ in range(3000):
+        draw.point((rng.randrange(SCAN_SIZE[0]), rng.randrange(SCAN_SIZE[1])), fill=rng.randint(100, 200))
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG', quality=75)
+    return buffered.getvalue()
+
+def page_kinds(kind, page_count):
+    """返回每页的类型列表"""
+    if kind == 'mixed':
+        return ['text' if i % 2 == 0 else 'scanned' for i in range(page_count)]
+    return [kind] * page_count
+
+def make_synthetic_pdf(path, kind='text', page_count=10, seed=0):
+    """生成指定类型和页数的合成PDF"""
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(None)  # 页面树在所有页面生成后回填
+    kids = []
+    for page_num, page_kind in enumerate(page_kinds(kind, page_count), 1):
+        if page_kind in ('text', 'table'):
+            stream = _text_page_stream(rng, page_num) if page_kind == 'text' else _table_page_stream(rng, page_num)
+            resources = b"<< /Font << /F1 %d 0 R >> >>" % font_id
+        else:
+            jpeg = _scanned_page_jpeg(rng, page_num)
+            image_id = add(
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n%s\nendstream"
+                % (SCAN_SIZE[0], SCAN_SIZE[1], len(jpeg), jpeg)
+            )
+            stream = b"q %d 0 0 %d 0 0 cm /Im1 Do Q" % (PAGE_WIDTH, PAGE_HEIGHT)
+            resources = b"<< /XObject << /Im1 %d 0 R >> >>" % image_id
+        content_id = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R /Resources %s >>"
+            % (pages_id, PAGE_WIDTH, PAGE_HEIGHT, content_id, resources)
+        ))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b' '.join(b"%d 0 R" % kid for kid in kids), len(kids))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for object_id, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (object_id, body))
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.write(b''.join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                % (len(objects) + 1, catalog_id, xref_offset))
+    return path
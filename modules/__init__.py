@@ -4,6 +4,11 @@
 - document_interpretation.py: 文档解读功能模块
 - pdf_image_processor.py: PDF图像处理功能模块  
 - video_processor.py: 视频处理功能模块
+- result_cache.py: 模型结果缓存模块
+- inference_client.py: 推理客户端模块
+- rate_limiter.py: 推理服务限流模块
+- page_dedup.py: 页面去重模块
+- request_policy.py: 调用策略模块
 
 后续添加的新功能模块也将归档到此文件夹中。
 """
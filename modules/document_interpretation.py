@@ -1,23 +1,181 @@
 import os
 import re
 import docx
+import random
+import openpyxl
 import pdfplumber
-import pandas as pd
-from openai import OpenAI
 from pptx import Presentation
-import chardet
+import codecs
+from chardet.universaldetector import UniversalDetector
+import threading
+import multiprocessing
 from datetime import datetime
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from modules.inference_client import get_client
+from modules.request_policy import get_call_policy
+from modules.result_cache import ResultCache, make_cache_key, file_sha256, cache_get, cache_set, DEFAULT_CACHE_DIR
 
-# 配置OpenAI客户端
-client = OpenAI(
-    base_url='https://api-inference.modelscope.cn/v1/',
-    api_key='your_api_key',
-)
+# pypdfium2为可选依赖，未安装时PDF文本只使用pdfplumber提取
+try:
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+except ImportError:
+    pdfium = None
+
+SUMMARY_MODEL_ID = 'Qwen/Qwen3-235B-A22B'
+
+# 分块总结（map-reduce）：估算token数超过 SUMMARY_SINGLE_PASS_TOKENS 的文本按章节边界切分为
+# 不超过 SUMMARY_CHUNK_TOKENS 的分块，并发总结各分块后再合并为最终解读
+SUMMARY_SINGLE_PASS_TOKENS = 60000
+SUMMARY_CHUNK_TOKENS = 12000
+SUMMARY_MAP_CONCURRENCY = 4
 
-# 额外配置
-extra_body = {
-    "enable_thinking": True,
+# 解读时的思考预算策略：按文档估算token数（乘以文档类型系数）查 REASONING_BUDGET_TIERS，
+# 取第一个上限不小于该值的档位；预算为0表示关闭思考，超过所有档位时使用 REASONING_MAX_BUDGET
+REASONING_BUDGET_TIERS = [
+    (2000, 0),
+    (8000, 1024),
+    (30000, 4096),
+    (SUMMARY_SINGLE_PASS_TOKENS, 8192),
+]
+REASONING_MAX_BUDGET = 16384
+# 文档类型系数：表格数据需要更多推理，字幕口语化、信息密度低
+REASONING_TYPE_FACTORS = {
+    '.xlsx': 2.0,
+    '.xls': 2.0,
+    '.srt': 0.5,
 }
+# 可按请求指定的思考模式，也可以直接指定思考预算（正整数）
+REASONING_MODES = ('auto', 'off', 'on')
+
+# 语言检测只使用文本开头的字符数
+LANGUAGE_SAMPLE_CHARS = 20000
+# TXT文件流式提取时每个文本块的字符数
+TXT_BLOCK_CHARS = 64 * 1024
+
+# Excel流式提取：每个工作表最多完整输出 EXCEL_MAX_ROWS_PER_SHEET 行且不超过 EXCEL_MAX_CELLS_PER_SHEET 个单元格，
+# 超出时输出前若干行、EXCEL_SAMPLE_ROWS 行随机抽样和各列统计；超过 EXCEL_MAX_COLUMNS 的列被忽略
+EXCEL_MAX_ROWS_PER_SHEET = 200
+EXCEL_MAX_CELLS_PER_SHEET = 5000
+EXCEL_SAMPLE_ROWS = 20
+EXCEL_MAX_COLUMNS = 50
+# 每个工作表最多读取的行数，超出部分不再读取，抽样与统计基于已读取的行（总行数取自工作表尺寸信息）
+EXCEL_MAX_SCAN_ROWS = 100000
+# 列统计中每列最多跟踪的不同取值数与输出的高频取值数
+EXCEL_STATS_MAX_DISTINCT = 1000
+EXCEL_STATS_TOP_VALUES = 5
+
+# 编码检测：先检查BOM，跳过开头的纯ASCII部分后尝试按UTF-8解码 ENCODING_SAMPLE_BYTES 字节，不是UTF-8时再逐块送入chardet，
+# 检测器有把握时提前结束，最多读取 ENCODING_DETECT_MAX_BYTES 字节
+ENCODING_SAMPLE_BYTES = 64 * 1024
+ENCODING_DETECT_MAX_BYTES = 1024 * 1024
+ENCODING_DETECT_BLOCK_BYTES = 8 * 1024
+# chardet识别出的这些编码按其超集解码，避免个别生僻字导致乱码
+ENCODING_SUPERSETS = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'ascii': 'utf-8', 'iso-8859-1': 'cp1252'}
+
+# PDF并行提取：页数不少于 PDF_PARALLEL_MIN_PAGES 时按 PDF_EXTRACT_RANGE_PAGES 页一段分片到多进程提取，
+# 按页码顺序拼回。默认关闭（PDF_EXTRACT_WORKERS = 1）：工作进程以spawn方式启动，会重新导入调用方的主模块，
+# 只有主模块的初始化（如 app.py 中加载Whisper模型）放在 if __name__ == '__main__' 之后时才适合开启
+PDF_PARALLEL_MIN_PAGES = 200
+PDF_EXTRACT_RANGE_PAGES = 50
+PDF_EXTRACT_WORKERS = 1
+
+# PDF文本提取后端：'pdfplumber' 版面分析准确但较慢；'pypdfium2' 只读文字层，速度快；
+# 'auto' 逐页选择，默认使用pypdfium2，矢量路径数不少于 PDF_TABLE_MIN_PATHS（疑似带框线表格）的页面改用pdfplumber
+PDF_TEXT_BACKEND = 'auto'
+PDF_TABLE_MIN_PATHS = 8
+
+# 分块摘要缓存：以分块内容、模型ID和提示词的哈希为键，文档修改后只重新总结变化的分块
+CHUNK_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, 'summary_chunks.db')
+CHUNK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 文档解读结果缓存：以文件内容哈希、模型ID和提示词为键保存提取文本与最终解读，重复上传的文件直接生成Word文档
+DOCUMENT_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, 'document_interpretations.db')
+DOCUMENT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DOCUMENT_CACHE_TTL = 7 * 24 * 3600  # 秒
+# 提取或解读流程发生变化（提示词以外）时修改该版本号，使旧缓存失效
+DOCUMENT_CACHE_VERSION = '2'
+
+# 提示词压缩：送入模型前删除逐页重复的页眉、页脚、页码和幻灯片模板文字，压缩表格中用于对齐的空白
+ENABLE_PROMPT_COMPACTION = True
+# 只在这些类型的单元中检测重复行，且只检查每个单元开头和结尾的 COMPACT_EDGE_LINES 个非空行
+COMPACT_UNIT_TYPES = ('page', 'slide')
+COMPACT_EDGE_LINES = 3
+# 先缓冲 COMPACT_WARMUP_UNITS 个单元统计重复行，之后边统计边输出
+COMPACT_WARMUP_UNITS = 10
+# 出现在至少 COMPACT_MIN_REPEATS 个单元、且不少于已读单元数 COMPACT_REPEAT_RATIO 的行视为模板文字
+COMPACT_MIN_REPEATS = 3
+COMPACT_REPEAT_RATIO = 0.5
+# 超过该长度的行视为正文，不参与重复检测（章节标题行同样不参与）
+COMPACT_MAX_LINE_CHARS = 200
+
+INTERPRETATION_PROMPTS = {
+    'zh-cn': """你是专业的文档解读专家。请详细总结并解读文件'{file_name}'的内容，要求：
+        1. 提炼关键要点和重要数据；
+        2. 分析潜在含义和实际应用建议；
+        3. 用结构化格式呈现，确保可读性。""",
+    'en': """You are a professional document interpreter. Please provide a detailed Chinese summary and interpretation of the content from file '{file_name}', including:
+        1. Key points and important data;
+        2. Potential implications and practical suggestions;
+        3. Structured formatting for readability.""",
+}
+
+CHUNK_SUMMARY_PROMPT = """你是专业的文档解读专家。下面是一份长文档中的一个片段，请用中文提炼该片段的内容，要求：
+1. 列出关键要点、重要数据和结论，保留具体数字、名称和条款编号；
+2. 只总结片段中出现的内容，不要推测片段以外的信息；
+3. 使用简洁的条目格式。"""
+
+# 章节标题行：markdown标题、中文章节编号、数字编号、幻灯片/工作表分隔等
+SECTION_HEADING_PATTERN = re.compile(
+    r'^\s*(#{1,6}\s|第[一二三四五六七八九十百零\d]+[章节条部分篇]|[一二三四五六七八九十]+、|\d+(\.\d+)*[.、]\s*\S'
+    r'|幻灯片 \d+:|工作表: |(chapter|section|part)\s+\d+)',
+    re.IGNORECASE
+)
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+# 单独成行的页码：12、- 12 -、Page 12、12 / 80、Page 12 of 80、第12页、第12页 共80页；
+# 带“第…页”或Page前缀的写法直接视为页码；只有数字或“N / M”“N of M”的行必须等于当前页码才视为页码，
+# 后者还要求总页数在各页中一致（去掉页码后的写法重复出现），避免删除“9 / 10”这类评分或数据
+PAGE_NUMBER_PATTERN = re.compile(
+    r'^\s*(?:第\s*(?P<chinese>\d+)\s*页(?:\s*[/，,]?\s*共\s*\d+\s*页)?'
+    r'|(?P<prefix>page|p\.)?\s*[-–—]?\s*(?P<number>\d+)\s*[-–—]?(?:\s*(?:/|of)\s*(?P<total>\d+))?)\s*$',
+    re.IGNORECASE
+)
+# 行内用于对齐的连续空白（空格、制表符、全角空格）
+PADDED_SPACE_PATTERN = re.compile(r'[ \t\u3000]{3,}')
+
+_chunk_cache = None
+_document_cache = None
+_chunk_cache_lock = threading.Lock()
+
+def get_chunk_cache():
+    """获取进程内共享的分块摘要缓存（首次使用时创建）"""
+    global _chunk_cache
+    with _chunk_cache_lock:
+        if _chunk_cache is None:
+            _chunk_cache = ResultCache(CHUNK_CACHE_PATH, CHUNK_CACHE_MAX_BYTES)
+        return _chunk_cache
+
+def get_document_cache():
+    """获取进程内共享的文档解读结果缓存（首次使用时创建）"""
+    global _document_cache
+    with _chunk_cache_lock:
+        if _document_cache is None:
+            _document_cache = ResultCache(DOCUMENT_CACHE_PATH, DOCUMENT_CACHE_MAX_BYTES, DOCUMENT_CACHE_TTL)
+        return _document_cache
+
+def document_cache_keys(file_hash, file_name, reasoning='auto'):
+    """返回 (提取文本缓存键, 解读结果缓存键)；提取文本与模型无关，解读结果随模型、提示词、文件名和思考设置变化
+    
+    解读提示词中包含文件名，同一文件以不同名称上传时不能复用解读结果，否则结果中会出现其他上传者的文件名。
+    """
+    text_key = make_cache_key('text', file_hash, DOCUMENT_CACHE_VERSION)
+    # 思考预算由文档内容和策略配置决定，键中记录请求的思考设置与策略配置即可在查询时确定
+    summary_key = make_cache_key('summary', file_hash, DOCUMENT_CACHE_VERSION, SUMMARY_MODEL_ID,
+                                 CHUNK_SUMMARY_PROMPT, *sorted(INTERPRETATION_PROMPTS.values()), file_name,
+                                 str(reasoning), repr(REASONING_BUDGET_TIERS), str(REASONING_MAX_BUDGET),
+                                 repr(sorted(REASONING_TYPE_FACTORS.items())))
+    return text_key, summary_key
 
 def detect_language(text):
     """简单的语言检测"""
@@ -39,145 +197,853 @@ def detect_language(text):
     
     return 'en'
 
-def extract_text_from_pdf(file_path):
-    """从PDF提取文本"""
+def make_unit(unit_type, number, text, **metadata):
+    """生成提取单元：unit_type 为 page/slide/sheet/paragraph/cue/block，text 自带结尾换行，按顺序拼接即为全文"""
+    unit = {'type': unit_type, 'number': number, 'text': text}
+    unit.update(metadata)
+    return unit
+
+def join_units(units):
+    """将提取单元拼接为完整文本"""
+    return ''.join(unit['text'] for unit in units)
+
+# pdfium不是线程安全的，同一进程内的调用需要串行
+_pdfium_lock = threading.Lock()
+
+def resolve_pdf_backend(backend=None):
+    """确定实际使用的PDF文本后端，pypdfium2未安装时回退到pdfplumber"""
+    backend = backend or PDF_TEXT_BACKEND
+    if backend not in PDF_TEXT_BACKENDS:
+        raise ValueError(f"未知的PDF文本后端: {backend}")
+    if backend != 'pdfplumber' and pdfium is None:
+        return 'pdfplumber'
+    return backend
+
+def get_pdf_page_count(file_path, backend=None):
+    """获取PDF页数"""
+    if resolve_pdf_backend(backend) != 'pdfplumber':
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(file_path)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
     with pdfplumber.open(file_path) as pdf:
-        text = ""
-        for page in pdf.pages:
-            text += page.extract_text() or ""
-    return text
+        return len(pdf.pages)
 
-def extract_text_from_docx(file_path):
-    """从Word文档提取文本"""
+def extract_pdf_range_pdfplumber(file_path, first_page, last_page):
+    """使用pdfplumber提取指定页码区间的文本"""
+    texts = []
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages[first_page - 1:last_page]:
+            texts.append(page.extract_text() or "")
+            # 释放页面解析缓存，内存占用不随页数增长
+            page.close()
+    return texts
+
+def _pdfium_page_text(page):
+    """读取pdfium页面的文字层，统一换行符"""
+    textpage = page.get_textpage()
+    try:
+        return textpage.get_text_range().replace('\r\n', '\n').replace('\r', '\n')
+    finally:
+        textpage.close()
+
+def count_pdfium_paths(page):
+    """统计页面中的矢量路径对象数，用于粗略判断是否存在带框线的表格"""
+    return sum(1 for _ in page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_PATH], max_depth=2))
+
+def extract_pdf_range_pdfium(file_path, first_page, last_page, table_fallback=False):
+    """使用pypdfium2提取指定页码区间的文本；table_fallback 为True时疑似含表格的页面改用pdfplumber"""
+    texts, table_pages = [], []
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            for page_num in range(first_page, last_page + 1):
+                page = pdf[page_num - 1]
+                try:
+                    if table_fallback and count_pdfium_paths(page) >= PDF_TABLE_MIN_PATHS:
+                        table_pages.append(page_num)
+                        texts.append(None)
+                    else:
+                        texts.append(_pdfium_page_text(page))
+                finally:
+                    page.close()
+        finally:
+            pdf.close()
+    
+    if table_pages:
+        with pdfplumber.open(file_path) as plumber_pdf:
+            for page_num in table_pages:
+                page = plumber_pdf.pages[page_num - 1]
+                texts[page_num - first_page] = page.extract_text() or ""
+                page.close()
+    return texts
+
+def extract_pdf_range_auto(file_path, first_page, last_page):
+    """逐页选择后端提取文本：默认pypdfium2，疑似含表格的页面使用pdfplumber"""
+    return extract_pdf_range_pdfium(file_path, first_page, last_page, table_fallback=True)
+
+PDF_TEXT_BACKENDS = {
+    'pdfplumber': extract_pdf_range_pdfplumber,
+    'pypdfium2': extract_pdf_range_pdfium,
+    'auto': extract_pdf_range_auto,
+}
+
+def _extract_pdf_range(file_path, first_page, last_page, backend='pdfplumber'):
+    """按指定后端提取页码区间的文本（可在提取进程中执行）"""
+    return PDF_TEXT_BACKENDS[backend](file_path, first_page, last_page)
+
+def iter_pdf_units(file_path, workers=None, backend=None):
+    """逐页产出PDF文本，页数达到 PDF_PARALLEL_MIN_PAGES 时分片到多进程并行提取
+    
+    backend 指定文本提取后端（默认 PDF_TEXT_BACKEND），可选值见 PDF_TEXT_BACKENDS。
+    """
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    backend = resolve_pdf_backend(backend)
+    page_count = get_pdf_page_count(file_path, backend)
+    ranges = [
+        (first_page, min(first_page + PDF_EXTRACT_RANGE_PAGES - 1, page_count))
+        for first_page in range(1, page_count + 1, PDF_EXTRACT_RANGE_PAGES)
+    ]
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        for first_page, last_page in ranges:
+            for i, text in enumerate(_extract_pdf_range(file_path, first_page, last_page, backend), first_page):
+                yield make_unit('page', i, text + "\n")
+        return
+    
+    print(f"PDF共 {page_count} 页，使用 {workers} 个进程并行提取文本")
+    # 最多同时提交 2 倍进程数的分片，按提交顺序取回以保证页码有序
+    # 使用spawn而非fork启动工作进程：fork多线程的Web服务进程时，子进程可能继承其他线程持有的 _pdfium_lock 而永久阻塞
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = deque()
+        for first_page, last_page in ranges:
+            pending.append((first_page, executor.submit(_extract_pdf_range, file_path, first_page, last_page, backend)))
+            if len(pending) >= workers * 2:
+                start_page, future = pending.popleft()
+                for i, text in enumerate(future.result(), start_page):
+                    yield make_unit('page', i, text + "\n")
+        while pending:
+            start_page, future = pending.popleft()
+            for i, text in enumerate(future.result(), start_page):
+                yield make_unit('page', i, text + "\n")
+
+def iter_docx_units(file_path):
+    """逐段产出Word文档文本"""
     doc = docx.Document(file_path)
-    full_text = []
-    for para in doc.paragraphs:
-        full_text.append(para.text)
-    return '\n'.join(full_text)
+    for i, para in enumerate(doc.paragraphs, 1):
+        yield make_unit('paragraph', i, para.text + "\n")
 
-def extract_text_from_excel(file_path):
-    """从Excel提取文本"""
-    xls = pd.ExcelFile(file_path)
-    text = ""
-    for sheet_name in xls.sheet_names:
-        df = xls.parse(sheet_name)
-        text += f"工作表: {sheet_name}\n"
-        text += df.to_string(na_rep='nan', index=False) + "\n\n"
-    return text
+class ColumnStats:
+    """流式累计单列统计：非空数、数值列的最小/最大/均值、文本列的高频取值"""
 
-def extract_text_from_pptx(file_path):
-    """从PowerPoint提取文本"""
+    def __init__(self, name):
+        self.name = name
+        self.non_empty = 0
+        self.numeric = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.values = Counter()
+
+    def add(self, value):
+        if value is None or value == '':
+            return
+        self.non_empty += 1
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self.numeric += 1
+            self.total += value
+            self.minimum = value if self.minimum is None else min(self.minimum, value)
+            self.maximum = value if self.maximum is None else max(self.maximum, value)
+        elif value in self.values or len(self.values) < EXCEL_STATS_MAX_DISTINCT:
+            # 不同取值过多时只继续统计已出现的取值，内存占用有上限
+            self.values[value] += 1
+
+    def describe(self):
+        """生成该列统计的一行描述"""
+        if self.numeric and self.numeric >= self.non_empty / 2:
+            return (f"数值 {self.numeric} 个，最小 {format_cell(self.minimum)}，最大 {format_cell(self.maximum)}，"
+                    f"均值 {format_cell(round(self.total / self.numeric, 4))}")
+        top_values = '、'.join(f"{format_cell(value)}({count})" for value, count in self.values.most_common(EXCEL_STATS_TOP_VALUES))
+        distinct = f"{len(self.values)}+" if len(self.values) >= EXCEL_STATS_MAX_DISTINCT else str(len(self.values))
+        return f"不同取值 {distinct} 个，高频取值: {top_values}"
+
+def format_cell(value):
+    """将单元格的值格式化为紧凑的markdown单元格文本"""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        # 整数值去掉小数点，其余保留10位有效数字
+        value = int(value) if value.is_integer() else float(f"{value:.10g}")
+    return str(value).replace('|', '\\|').replace('\r', ' ').replace('\n', ' ').strip()
+
+def rows_to_markdown(rows, width):
+    """将行列表渲染为markdown表格，第一行作为表头"""
+    if not rows:
+        return ''
+    lines = []
+    for i, row in enumerate(rows):
+        cells = [format_cell(value) for value in row[:width]] + [''] * (width - len(row))
+        lines.append('| ' + ' | '.join(cells) + ' |')
+        if i == 0:
+            lines.append('|' + ' --- |' * width)
+    return '\n'.join(lines) + '\n'
+
+def xls_cell_value(cell, datemode):
+    """读取xls单元格的值：日期单元格在xlrd中是序列号浮点数，需转换为日期时间；布尔单元格转换为True/False"""
+    import xlrd
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        try:
+            return xlrd.xldate_as_datetime(cell.value, datemode)
+        except (xlrd.xldate.XLDateError, ValueError, OverflowError):
+            return cell.value
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    return cell.value
+
+def iter_excel_rows(file_path):
+    """逐个工作表产出 (工作表名, 行迭代器, 声明的总行数)，xlsx以只读模式流式读取，xls按需加载工作表"""
+    if file_path.lower().endswith('.xls'):
+        import xlrd
+        book = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            for sheet_name in book.sheet_names():
+                sheet = book.sheet_by_name(sheet_name)
+                rows = (tuple(xls_cell_value(cell, book.datemode) for cell in row) for row in sheet.get_rows())
+                yield sheet_name, rows, sheet.nrows
+                book.unload_sheet(sheet_name)
+        finally:
+            book.release_resources()
+        return
+    
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            # 只读模式下 max_row 来自工作表的尺寸声明，缺失时为None
+            yield worksheet.title, worksheet.iter_rows(values_only=True), worksheet.max_row
+    finally:
+        workbook.close()
+
+def render_sheet(sheet_name, rows, declared_rows=None):
+    """在行数/单元格预算内渲染单个工作表
+    
+    不超过预算的工作表完整输出为markdown表格；超出预算时输出前若干行、随机抽样行和各列统计。
+    只保留有限的行在内存中，且最多读取 EXCEL_MAX_SCAN_ROWS 行，耗时和内存不随工作表大小增长。
+    """
+    header, head_rows, sample_rows = None, [], []
+    width, row_count = 0, 0
+    stats = []
+    # 固定随机种子，同一文件的抽样结果稳定，分块摘要缓存可以复用
+    rng = random.Random(0)
+    row_budget = EXCEL_MAX_ROWS_PER_SHEET
+    scan_truncated = False
+    
+    for scanned, row in enumerate(rows, 1):
+        if scanned > EXCEL_MAX_SCAN_ROWS:
+            scan_truncated = True
+            break
+        # 去掉行尾空单元格，跳过空行
+        row = list(row[:EXCEL_MAX_COLUMNS])
+        while row and (row[-1] is None or row[-1] == ''):
+            row.pop()
+        if not row:
+            continue
+        if header is None:
+            header = row
+            width = len(row)
+            stats = [ColumnStats(format_cell(value) or f"列{i}") for i, value in enumerate(row, 1)]
+            row_budget = max(1, min(EXCEL_MAX_ROWS_PER_SHEET, EXCEL_MAX_CELLS_PER_SHEET // max(width, 1)))
+            continue
+        
+        if len(row) > width:
+            stats.extend(ColumnStats(f"列{i}") for i in range(width + 1, len(row) + 1))
+            width = len(row)
+        row_count += 1
+        for column, value in zip(stats, row):
+            column.add(value)
+        
+        if row_count <= row_budget:
+            head_rows.append(row)
+        elif len(sample_rows) < EXCEL_SAMPLE_ROWS:
+            sample_rows.append(row)
+        else:
+            # 蓄水池抽样：超出预算的每一行以相同概率进入样本
+            index = rng.randrange(row_count - row_budget)
+            if index < EXCEL_SAMPLE_ROWS:
+                sample_rows[index] = row
+    
+    if header is None:
+        return f"工作表: {sheet_name}\n（空）\n\n"
+    header = header + [f"列{i}" for i in range(len(header) + 1, width + 1)]
+    if row_count <= row_budget:
+        return f"工作表: {sheet_name}\n" + rows_to_markdown([header] + head_rows, width) + "\n"
+    
+    if scan_truncated:
+        total = f"共约 {declared_rows} 行" if declared_rows else f"超过 {EXCEL_MAX_SCAN_ROWS} 行"
+        scope = f"抽样与统计基于前 {row_count} 行数据"
+    else:
+        total, scope = f"共 {row_count} 行", "统计基于全部数据"
+    lines = [
+        f"工作表: {sheet_name}（{total} × {width} 列，超出预算，"
+        f"以下为前 {len(head_rows)} 行、随机抽样 {len(sample_rows)} 行及各列统计，{scope}）",
+        rows_to_markdown([header] + head_rows, width),
+        "抽样行:",
+        rows_to_markdown([header] + sample_rows, width),
+        "各列统计:",
+    ]
+    lines.extend(f"- {column.name}: 非空 {column.non_empty} 个，{column.describe()}" for column in stats)
+    return '\n'.join(lines) + "\n\n"
+
+def iter_excel_units(file_path):
+    """逐个工作表流式产出Excel文本，超大工作表按预算抽样并附列统计"""
+    for i, (sheet_name, rows, declared_rows) in enumerate(iter_excel_rows(file_path), 1):
+        yield make_unit('sheet', i, render_sheet(sheet_name, rows, declared_rows), name=sheet_name)
+
+def iter_pptx_units(file_path):
+    """逐页产出幻灯片文本"""
     prs = Presentation(file_path)
-    text = ""
     for i, slide in enumerate(prs.slides, 1):
-        text += f"幻灯片 {i}:\n"
+        lines = [f"幻灯片 {i}:"]
         for shape in slide.shapes:
             if hasattr(shape, "text"):
-                text += shape.text + "\n"
-        text += "\n"
-    return text
+                lines.append(shape.text)
+        yield make_unit('slide', i, "\n".join(lines) + "\n\n")
 
-def extract_text_from_srt(file_path):
-    """从SRT字幕文件提取文本"""
+def detect_file_encoding(file_path):
+    """检测文本文件编码，只读取文件开头的有限字节"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_BYTES)
+        if sample.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return 'utf-16'
+        
+        # 纯ASCII内容对UTF-8和GBK等编码都合法，无法据此判断；跳过开头的纯ASCII部分，
+        # 从出现非ASCII字节的位置开始检测，读满 ENCODING_DETECT_MAX_BYTES 仍是纯ASCII时按UTF-8处理
+        read_bytes = len(sample)
+        while sample.isascii():
+            if read_bytes >= ENCODING_DETECT_MAX_BYTES:
+                return 'utf-8'
+            sample = f.read(ENCODING_SAMPLE_BYTES)
+            if not sample:
+                return 'utf-8'
+            read_bytes += len(sample)
+        
+        # 常见的UTF-8文件直接确认，样本末尾被截断的多字节字符不算错误
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+        
+        detector = UniversalDetector()
+        data = sample
+        while data:
+            for offset in range(0, len(data), ENCODING_DETECT_BLOCK_BYTES):
+                detector.feed(data[offset:offset + ENCODING_DETECT_BLOCK_BYTES])
+                if detector.done:
+                    break
+            if detector.done or read_bytes >= ENCODING_DETECT_MAX_BYTES:
+                break
+            data = f.read(ENCODING_DETECT_BLOCK_BYTES)
+            read_bytes += len(data)
+        detector.close()
+    
+    encoding = (detector.result.get('encoding') or 'utf-8').lower()
+    return ENCODING_SUPERSETS.get(encoding, encoding)
+
+def iter_srt_units(file_path):
+    """逐条产出SRT字幕文本"""
     try:
         # 尝试检测文件编码
-        with open(file_path, 'rb') as f:
-            raw_data = f.read()
-            encoding = chardet.detect(raw_data)['encoding']
-        
-        # 使用检测到的编码读取文件
-        with open(file_path, 'r', encoding=encoding or 'utf-8') as f:
-            content = f.read()
+        encoding = detect_file_encoding(file_path)
         
-        # 解析SRT格式
-        text = ""
-        lines = content.strip().split('\n')
-        i = 0
-        while i < len(lines):
-            # 跳过序号行
-            if lines[i].strip().isdigit():
-                i += 1
+        # 使用检测到的编码单遍逐行读取，解析SRT格式（检测样本之后的个别非法字节替换为占位符）
+        with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+            lines = iter(f)
+            number = 0
+            for line in lines:
+                # 跳过序号行
+                if not line.strip().isdigit():
+                    continue
                 # 跳过时间戳行
-                if i < len(lines) and '-->' in lines[i]:
-                    i += 1
-                    # 读取字幕文本
-                    subtitle_text = ""
-                    while i < len(lines) and lines[i].strip() != "":
-                        subtitle_text += lines[i] + " "
-                        i += 1
-                    text += subtitle_text.strip() + "\n"
-            i += 1
-        return text
+                timestamp = next(lines, '')
+                if '-->' not in timestamp:
+                    continue
+                # 读取字幕文本
+                subtitle_lines = []
+                for line in lines:
+                    if line.strip() == "":
+                        break
+                    subtitle_lines.append(line.rstrip('\r\n'))
+                number += 1
+                start, _, end = timestamp.partition('-->')
+                yield make_unit('cue', number, " ".join(subtitle_lines).strip() + "\n",
+                                start=start.strip(), end=end.strip())
     except Exception as e:
         print(f"读取SRT文件失败: {e}")
-        return ""
 
-def extract_text_from_txt(file_path):
-    """从TXT文本文件提取文本"""
+def iter_txt_units(file_path):
+    """按固定大小的行块产出TXT文本"""
     try:
         # 尝试检测文件编码
-        with open(file_path, 'rb') as f:
-            raw_data = f.read()
-            encoding = chardet.detect(raw_data)['encoding']
+        encoding = detect_file_encoding(file_path)
         
-        # 使用检测到的编码读取文件
-        with open(file_path, 'r', encoding=encoding or 'utf-8') as f:
-            return f.read()
+        # 使用检测到的编码单遍逐行读取，累计到 TXT_BLOCK_CHARS 字符产出一块
+        with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+            number = 0
+            block, block_chars = [], 0
+            for line in f:
+                block.append(line)
+                block_chars += len(line)
+                if block_chars >= TXT_BLOCK_CHARS:
+                    number += 1
+                    yield make_unit('block', number, ''.join(block))
+                    block, block_chars = [], 0
+            if block:
+                yield make_unit('block', number + 1, ''.join(block))
     except Exception as e:
         print(f"读取TXT文件失败: {e}")
-        return ""
 
-def get_file_extractor(file_path):
-    """根据文件扩展名获取对应的文本提取函数"""
+def extract_text_from_pdf(file_path):
+    """从PDF提取文本"""
+    return join_units(iter_pdf_units(file_path))
+
+def extract_text_from_docx(file_path):
+    """从Word文档提取文本"""
+    return join_units(iter_docx_units(file_path))
+
+def extract_text_from_excel(file_path):
+    """从Excel提取文本"""
+    return join_units(iter_excel_units(file_path))
+
+def extract_text_from_pptx(file_path):
+    """从PowerPoint提取文本"""
+    return join_units(iter_pptx_units(file_path))
+
+def extract_text_from_srt(file_path):
+    """从SRT字幕文件提取文本"""
+    return join_units(iter_srt_units(file_path))
+
+def extract_text_from_txt(file_path):
+    """从TXT文本文件提取文本"""
+    return join_units(iter_txt_units(file_path))
+
+def get_file_extractor(file_path, streaming=False):
+    """根据文件扩展名获取对应的文本提取函数
+    
+    streaming 为True时返回逐单元产出 (页/幻灯片/工作表等) 的生成器函数，否则返回一次性返回全文的函数。
+    """
     file_ext = file_path.lower().split('.')[-1]
     extractors = {
-        'pdf': extract_text_from_pdf,
-        'docx': extract_text_from_docx,
-        'doc': extract_text_from_docx,
-        'xlsx': extract_text_from_excel,
-        'xls': extract_text_from_excel,
-        'pptx': extract_text_from_pptx,
-        'ppt': extract_text_from_pptx,
-        'srt': extract_text_from_srt,
-        'txt': extract_text_from_txt,
+        'pdf': (extract_text_from_pdf, iter_pdf_units),
+        'docx': (extract_text_from_docx, iter_docx_units),
+        'doc': (extract_text_from_docx, iter_docx_units),
+        'xlsx': (extract_text_from_excel, iter_excel_units),
+        'xls': (extract_text_from_excel, iter_excel_units),
+        'pptx': (extract_text_from_pptx, iter_pptx_units),
+        'ppt': (extract_text_from_pptx, iter_pptx_units),
+        'srt': (extract_text_from_srt, iter_srt_units),
+        'txt': (extract_text_from_txt, iter_txt_units),
     }
-    return extractors.get(file_ext)
+    if file_ext not in extractors:
+        return None
+    return extractors[file_ext][1 if streaming else 0]
 
-def summarize_and_interpret(text, language, file_name):
-    """使用Qwen3总结和解读文本"""
-    if language == 'zh-cn':
-        system_prompt = f"""你是专业的文档解读专家。请详细总结并解读文件'{file_name}'的内容，要求：
-        1. 提炼关键要点和重要数据；
-        2. 分析潜在含义和实际应用建议；
-        3. 用结构化格式呈现，确保可读性。"""
-    else:
-        system_prompt = f"""You are a professional document interpreter. Please provide a detailed Chinese summary and interpretation of the content from file '{file_name}', including:
-        1. Key points and important data;
-        2. Potential implications and practical suggestions;
-        3. Structured formatting for readability."""
+def estimate_tokens(text):
+    """粗略估算文本的token数：中日韩字符按每字1个token，其余按每4个字符1个token"""
+    cjk_chars = len(CJK_PATTERN.findall(text))
+    return cjk_chars + (len(text) - cjk_chars) // 4 + 1
+
+def split_sections(text):
+    """在章节标题行处切分文本，返回各章节文本（保留原有换行）"""
+    sections = []
+    current = []
+    for line in text.splitlines(keepends=True):
+        if current and SECTION_HEADING_PATTERN.match(line):
+            sections.append(''.join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append(''.join(current))
+    return sections
+
+def pack_chunks(pieces, max_tokens, split_piece=None):
+    """将文本片段按顺序合并为不超过 max_tokens 的分块，单个片段超长时用 split_piece 继续拆分"""
+    chunks = []
+    current, current_tokens = [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if tokens > max_tokens:
+            sub_pieces = split_piece(piece) if split_piece else None
+            if not sub_pieces or len(sub_pieces) <= 1:
+                # 无法再按结构拆分时按字符数硬切分
+                step = max(1, len(piece) * max_tokens // tokens)
+                sub_pieces = [piece[i:i + step] for i in range(0, len(piece), step)]
+            chunks_from_piece = pack_chunks(sub_pieces, max_tokens)
+        else:
+            chunks_from_piece = None
+        
+        if chunks_from_piece is not None or current_tokens + tokens > max_tokens:
+            if current:
+                chunks.append(''.join(current))
+            current, current_tokens = [], 0
+        if chunks_from_piece is not None:
+            # 最后一个分块通常未填满，继续与后续片段合并
+            chunks.extend(chunks_from_piece[:-1])
+            current, current_tokens = chunks_from_piece[-1:], estimate_tokens(chunks_from_piece[-1])
+            continue
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+def split_into_chunks(text, max_tokens=SUMMARY_CHUNK_TOKENS):
+    """按章节边界把文本切分为token预算内的分块，超长章节再按段落、行拆分"""
+    def split_paragraphs(section):
+        paragraphs = re.split(r'(?<=\n\n)', section)
+        return paragraphs if len(paragraphs) > 1 else section.splitlines(keepends=True)
+    return [chunk for chunk in pack_chunks(split_sections(text), max_tokens, split_paragraphs) if chunk.strip()]
+
+def summarize_chunk(chunk, cache=None):
+    """总结单个分块，优先读取缓存"""
+    cache_key = make_cache_key(chunk, SUMMARY_MODEL_ID, CHUNK_SUMMARY_PROMPT) if cache is not None else None
+    summary = cache_get(cache, cache_key)
+    if summary is not None:
+        return summary
     
-    # 限制输入长度
-    truncated_text = text[:100000]
-    response = client.chat.completions.create(
-        model='Qwen/Qwen3-235B-A22B',
+    response = get_call_policy('summary_chunk').call(
+        get_client().chat.completions.create,
+        model=SUMMARY_MODEL_ID,
         messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": truncated_text}
+            {"role": "system", "content": CHUNK_SUMMARY_PROMPT},
+            {"role": "user", "content": chunk}
         ],
-        stream=True,
-        extra_body=extra_body
+        # 分块摘要只做信息提炼，关闭思考以缩短耗时
+        extra_body={"enable_thinking": False}
+    )
+    summary = (response.choices[0].message.content or '').strip()
+    if summary:
+        cache_set(cache, cache_key, summary)
+    return summary
+
+def join_chunk_summaries(summaries):
+    """按顺序拼接各分块摘要"""
+    return '\n\n'.join(
+        f"【第 {i} 部分摘要（共 {len(summaries)} 部分）】\n{summary}" for i, summary in enumerate(summaries, 1)
     )
+
+def map_summarize(text, file_name, use_cache=True, level=1):
+    """分块并发总结超长文本，返回拼接后的分块摘要；摘要仍然超长时继续逐层归并"""
+    cache = get_chunk_cache() if use_cache else None
+    while estimate_tokens(text) > SUMMARY_SINGLE_PASS_TOKENS:
+        chunks = split_into_chunks(text)
+        print(f"{file_name} 第 {level} 轮分块总结: {len(chunks)} 个分块")
+        with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_MAP_CONCURRENCY, len(chunks)))) as executor:
+            summaries = list(executor.map(lambda chunk: summarize_chunk(chunk, cache), chunks))
+        text = join_chunk_summaries(summaries)
+        level += 1
+    if cache is not None:
+        print(f"分块摘要缓存统计: {cache.stats()}")
+    return f"以下是文档各部分的摘要，请据此完成整体解读：\n\n{text}"
+
+def compaction_line_key(line, number):
+    """重复行的比较键：忽略首尾空白，并把行中的当前页码替换为占位符，使“报告名称 - 第3页”这类逐页变化的页眉也能匹配"""
+    return re.sub(rf'(?<!\d){number}(?!\d)', '#', line.strip())
+
+def is_page_number_line(line, number, is_repeated=None):
+    """判断行是否为当前页的页码；is_repeated(line) 用于确认“N / M”写法在各页中重复出现"""
+    match = PAGE_NUMBER_PATTERN.match(line)
+    if match is None:
+        return False
+    if match.group('chinese') or match.group('prefix'):
+        return True
+    if int(match.group('number')) != number:
+        return False
+    if match.group('total'):
+        return is_repeated is not None and is_repeated(line)
+    return True
+
+def is_markdown_table_line(stripped):
+    """至少两列的markdown表格行"""
+    return len(stripped) > 1 and stripped[0] == '|' and stripped[-1] == '|' and stripped.count('|') >= 3
+
+def is_aligned_table_line(stripped):
+    """用连续空白对齐的表格行：去掉首尾空白后至少还有两处3个以上的连续空白"""
+    return len(PADDED_SPACE_PATTERN.findall(stripped)) >= 2
+
+def compact_table_lines(lines):
+    """压缩表格中用于对齐的空白：markdown表格去掉单元格填充；连续两行以上的空白对齐行改用 | 分隔列，
+    其余行只去掉行尾空白，缩进保持不变"""
+    aligned = [is_aligned_table_line(line.strip()) for line in lines]
+    compacted = []
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if is_markdown_table_line(stripped):
+            cells = [cell.strip() for cell in stripped[1:-1].split('|')]
+            if all(cell and set(cell) <= set('-:') for cell in cells):
+                compacted.append('|' + '---|' * len(cells))
+            else:
+                compacted.append('| ' + ' | '.join(cells) + ' |')
+        elif aligned[i] and ((i > 0 and aligned[i - 1]) or (i + 1 < len(lines) and aligned[i + 1])):
+            compacted.append(PADDED_SPACE_PATTERN.sub(' | ', stripped))
+        else:
+            compacted.append(line.rstrip())
+    return compacted
+
+def is_boilerplate_candidate(line):
+    """判断边缘行是否参与重复检测：过长的行视为正文（章节标题和“幻灯片 N:”等单元标记不属于边缘行）"""
+    return len(line) <= COMPACT_MAX_LINE_CHARS
+
+def compact_units(units, stats=None):
+    """压缩提取单元流，删除逐页重复的页眉页脚、页码和模板文字并压缩表格空白，按原顺序产出新单元
+    
+    只处理 COMPACT_UNIT_TYPES 中的页面和幻灯片，其他类型的单元原样输出。每种模板行保留第一次出现，
+    模型仍能看到一次文档标题等信息；stats 字典中累计压缩前后的字符数、估算token数和删除的行数。
+    """
+    if stats is None:
+        stats = {}
+    for key in ('chars_before', 'chars_after', 'tokens_before', 'tokens_after', 'lines_removed'):
+        stats.setdefault(key, 0)
+    counts = Counter()
+    emitted_keys = set()
+    seen_units = 0
+    buffered = []
+    
+    def edge_indexes(lines):
+        # 章节标题和单元标记不计入内容行；内容行较少时缩小检测范围，至少保留中间一行不参与检测，
+        # 避免“指标名称/数值”这类短幻灯片被整页当作模板删除
+        indexes = [i for i, line in enumerate(lines) if line.strip() and not SECTION_HEADING_PATTERN.match(line)]
+        size = min(COMPACT_EDGE_LINES, (len(indexes) - 1) // 2)
+        return set(indexes[:size] + indexes[-size:]) if size > 0 else set()
+    
+    def is_boilerplate(key):
+        return counts[key] >= max(COMPACT_MIN_REPEATS, seen_units * COMPACT_REPEAT_RATIO)
+    
+    def compact(unit):
+        text = unit['text']
+        if unit['type'] not in COMPACT_UNIT_TYPES:
+            tokens = estimate_tokens(text)
+            stats['chars_before'] += len(text)
+            stats['chars_after'] += len(text)
+            stats['tokens_before'] += tokens
+            stats['tokens_after'] += tokens
+            return unit
+        body = text.rstrip('\n')
+        lines = body.split('\n')
+        edges = edge_indexes(lines)
+        kept = []
+        for i, line in enumerate(lines):
+            if i in edges:
+                if is_page_number_line(line, unit['number'],
+                                       lambda l: is_boilerplate(compaction_line_key(l, unit['number']))):
+                    stats['lines_removed'] += 1
+                    continue
+                if is_boilerplate_candidate(line):
+                    key = compaction_line_key(line, unit['number'])
+                    if is_boilerplate(key):
+                        if key in emitted_keys:
+                            stats['lines_removed'] += 1
+                            continue
+                        emitted_keys.add(key)
+            # 连续空行只保留一个
+            if line.strip() or (kept and kept[-1].strip()):
+                kept.append(line)
+        compacted = '\n'.join(compact_table_lines(kept)).strip('\n')
+        # 保留单元结尾的换行，拼接后的段落结构不变；整个单元都被删除时不输出内容
+        compacted = compacted + text[len(body):] if compacted else ''
+        stats['chars_before'] += len(text)
+        stats['chars_after'] += len(compacted)
+        stats['tokens_before'] += estimate_tokens(text)
+        stats['tokens_after'] += estimate_tokens(compacted)
+        return dict(unit, text=compacted)
+    
+    for unit in units:
+        if unit['type'] in COMPACT_UNIT_TYPES:
+            seen_units += 1
+            lines = unit['text'].split('\n')
+            counts.update({
+                compaction_line_key(lines[i], unit['number']) for i in edge_indexes(lines)
+                if is_boilerplate_candidate(lines[i])
+            })
+            # 预热阶段先缓冲，统计到足够多的单元后再判断哪些行是模板文字
+            if seen_units <= COMPACT_WARMUP_UNITS:
+                buffered.append(unit)
+                continue
+        elif buffered:
+            buffered.append(unit)
+            continue
+        for pending in buffered:
+            yield compact(pending)
+        buffered = []
+        yield compact(unit)
+    for pending in buffered:
+        yield compact(pending)
+
+def format_compaction_stats(stats):
+    """生成提示词压缩效果的说明文字"""
+    saved = stats['tokens_before'] - stats['tokens_after']
+    ratio = saved / stats['tokens_before'] * 100 if stats['tokens_before'] else 0.0
+    return (f"提示词压缩: 删除 {stats['lines_removed']} 行重复页眉页脚/页码，"
+            f"字符数 {stats['chars_before']} -> {stats['chars_after']}，约节省 {saved} tokens（{ratio:.1f}%）")
+
+def prepare_summary_input(units, file_name, use_cache=True):
+    """消费提取单元流，生成送入最终解读的文本，返回 (文本, 语言检测样本, 提取字符数)
+    
+    累计文本不超过 SUMMARY_SINGLE_PASS_TOKENS 时返回全文；超过后切换为分块模式，
+    每凑满一个分块就提交总结，提取与分块总结同时进行。等待总结的分块达到 SUMMARY_MAP_CONCURRENCY 的2倍时
+    暂停提取、等待最早的分块完成，内存中只保留未满的分块、有限个排队的分块与已完成的摘要。
+    """
+    cache = get_chunk_cache() if use_cache else None
+    buffered, buffered_tokens = [], 0
+    sample, char_count = [], 0
+    executor, futures = None, []
+    pending = deque()
+    max_pending = max(1, SUMMARY_MAP_CONCURRENCY) * 2
+    
+    def submit(chunk):
+        if chunk.strip():
+            future = executor.submit(summarize_chunk, chunk, cache)
+            futures.append(future)
+            pending.append(future)
+            # 提取远快于分块总结，排队的分块过多时等待最早提交的分块完成，避免整篇文档堆积在队列中
+            while len(pending) >= max_pending:
+                pending.popleft().result()
+    
+    try:
+        for unit in units:
+            text = unit['text']
+            if char_count < LANGUAGE_SAMPLE_CHARS:
+                sample.append(text[:LANGUAGE_SAMPLE_CHARS - char_count])
+            char_count += len(text)
+            
+            for piece in split_sections(text):
+                tokens = estimate_tokens(piece)
+                if executor is None:
+                    buffered.append(piece)
+                    buffered_tokens += tokens
+                    if buffered_tokens <= SUMMARY_SINGLE_PASS_TOKENS:
+                        continue
+                    # 超出单次处理预算，已缓存的文本按分块提交，之后边提取边总结
+                    print(f"{file_name} 文本超出单次处理预算，切换为分块总结")
+                    executor = ThreadPoolExecutor(max_workers=max(1, SUMMARY_MAP_CONCURRENCY))
+                    chunks = split_into_chunks(''.join(buffered))
+                    for chunk in chunks[:-1]:
+                        submit(chunk)
+                    buffered = chunks[-1:]
+                    buffered_tokens = estimate_tokens(buffered[0]) if buffered else 0
+                    continue
+                
+                if tokens > SUMMARY_CHUNK_TOKENS:
+                    submit(''.join(buffered))
+                    chunks = split_into_chunks(piece)
+                    for chunk in chunks[:-1]:
+                        submit(chunk)
+                    buffered = chunks[-1:]
+                    buffered_tokens = estimate_tokens(buffered[0]) if buffered else 0
+                elif buffered_tokens + tokens > SUMMARY_CHUNK_TOKENS:
+                    submit(''.join(buffered))
+                    buffered, buffered_tokens = [piece], tokens
+                else:
+                    buffered.append(piece)
+                    buffered_tokens += tokens
+        
+        sample = ''.join(sample)
+        if executor is None:
+            return ''.join(buffered), sample, char_count
+        
+        submit(''.join(buffered))
+        print(f"{file_name} 第 1 轮分块总结: {len(futures)} 个分块")
+        summaries = [future.result() for future in futures]
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    return map_summarize(join_chunk_summaries(summaries), file_name, use_cache, level=2), sample, char_count
+
+def parse_reasoning_override(value):
+    """解析请求中的思考设置：REASONING_MODES 之一或正整数思考预算，无法识别时按 'auto' 处理"""
+    if value is None:
+        return 'auto'
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value if value > 0 else 'off'
+    value = str(value).strip().lower()
+    if value in REASONING_MODES:
+        return value
+    if value.isdigit():
+        return int(value) if int(value) > 0 else 'off'
+    print(f"无法识别的思考设置: {value}，使用自动策略")
+    return 'auto'
+
+def choose_reasoning(source_tokens, file_name, override='auto'):
+    """根据文档估算token数和类型选择思考设置，返回传给模型的 extra_body"""
+    override = parse_reasoning_override(override)
+    if override == 'off':
+        return {"enable_thinking": False}
+    if isinstance(override, int):
+        return {"enable_thinking": True, "thinking_budget": override}
     
-    summary = ""
-    done_thinking = False
-    for chunk in response:
-        answer_chunk = chunk.choices[0].delta.content
-        if answer_chunk:
-            if not done_thinking:
-                summary += "\n\n=== 文档解读结果 ===\n"
-                done_thinking = True
-            summary += answer_chunk
-    return summary.strip()
+    factor = REASONING_TYPE_FACTORS.get(os.path.splitext(file_name)[1].lower(), 1.0)
+    weighted_tokens = source_tokens * factor
+    budget = next((b for limit, b in REASONING_BUDGET_TIERS if weighted_tokens <= limit), REASONING_MAX_BUDGET)
+    if budget == 0:
+        # 强制开启思考时短文档也使用最低一档非零预算
+        if override != 'on':
+            return {"enable_thinking": False}
+        budget = next(b for _, b in REASONING_BUDGET_TIERS if b > 0)
+    return {"enable_thinking": True, "thinking_budget": budget}
+
+def summarize_and_interpret(text, language, file_name, on_token=None, reasoning=None):
+    """使用Qwen3总结和解读文本，超长文本先分块总结再合并解读
+    
+    指定 on_token(kind, text) 时实时推送流式输出：kind 为 'thinking'（思考过程）或 'answer'（解读内容），
+    请求被重试时先推送 'reset'，接收方应丢弃此前收到的内容。
+    reasoning 为 choose_reasoning 返回的思考设置，未指定时按文本长度自动选择。
+    """
+    if reasoning is None:
+        reasoning = choose_reasoning(estimate_tokens(text), file_name)
+    system_prompt = INTERPRETATION_PROMPTS['zh-cn' if language == 'zh-cn' else 'en'].format(file_name=file_name)
+    
+    # 超长文本先分块总结，再对各分块摘要做最终解读
+    if estimate_tokens(text) > SUMMARY_SINGLE_PASS_TOKENS:
+        text = map_summarize(text, file_name)
+    
+    def stream_summary(timeout=None):
+        response = get_client().chat.completions.create(
+            model=SUMMARY_MODEL_ID,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": text}
+            ],
+            stream=True,
+            extra_body=reasoning,
+            timeout=timeout
+        )
+        
+        if on_token is not None:
+            on_token('reset', '')
+        
+        summary = []
+        done_thinking = False
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            thinking_chunk = getattr(delta, 'reasoning_content', None)
+            if thinking_chunk and on_token is not None:
+                on_token('thinking', thinking_chunk)
+            answer_chunk = delta.content
+            if answer_chunk:
+                if not done_thinking:
+                    summary.append("\n\n=== 文档解读结果 ===\n")
+                    done_thinking = True
+                summary.append(answer_chunk)
+                if on_token is not None:
+                    on_token('answer', answer_chunk)
+        return ''.join(summary).strip()
+    
+    # 整个流式读取过程占用一个限流名额，被限流、超时或连接中断时自动重试
+    return get_call_policy('summary').call(stream_summary)
 
 def parse_inline_formatting(text):
     """解析内联格式（粗体、斜体等）"""
@@ -332,68 +1198,73 @@ def clean_filename(filename):
 
 def process_single_document(file_path, output_folder):
     """处理单个文档文件"""
-    try:
-        print(f"开始处理文件: {file_path}")
-        
-        # 获取文件提取函数
-        extractor = get_file_extractor(file_path)
-        if not extractor:
-            raise Exception(f"不支持的文件格式: {file_path}")
-        
-        # 提取文本
-        text = extractor(file_path)
-        if not text or not text.strip():
-            raise Exception("文件内容为空或无法提取文本")
-        
-        print(f"成功提取文本，长度: {len(text)}")
-        
-        # 检测语言
-        language = detect_language(text)
-        print(f"检测到语言: {language}")
-        
-        # 生成总结
-        file_name = os.path.basename(file_path)
-        summary = summarize_and_interpret(text, language, file_name)
-        
-        # 保存结果
-        cleaned_name = clean_filename(file_name)
-        current_date = datetime.now().strftime("%Y%m%d")
-        output_file_name = f"{cleaned_name}_{current_date}.docx"
-        output_file_path = os.path.join(output_folder, output_file_name)
-        save_to_word(summary, output_file_path)
-        
-        print(f"处理完成，结果保存到: {output_file_path}")
-        return True, "处理成功"
-        
-    except Exception as e:
-        error_msg = f"处理文件失败: {str(e)}"
-        print(error_msg)
-        return False, error_msg
+    return process_single_document_with_name(file_path, output_folder)
 
-def process_single_document_with_name(file_path, output_folder, original_filename=None):
-    """处理单个文档文件，可以指定用于命名的原始文件名"""
+def process_single_document_with_name(file_path, output_folder, original_filename=None, use_cache=True, on_token=None,
+                                      reasoning='auto'):
+    """处理单个文档文件，可以指定用于命名的原始文件名
+    
+    启用缓存时，相同内容的文件直接复用已保存的解读结果生成Word文档，不调用模型；
+    只有提取文本命中缓存时跳过文本提取。on_token 用于实时推送解读输出，参见 summarize_and_interpret。
+    reasoning 为请求指定的思考设置（'auto'、'off'、'on' 或思考预算），参见 choose_reasoning。
+    """
     try:
         print(f"开始处理文件: {file_path}")
         
-        # 获取文件提取函数
-        extractor = get_file_extractor(file_path)
+        # 获取流式文件提取函数
+        extractor = get_file_extractor(file_path, streaming=True)
         if not extractor:
             raise Exception(f"不支持的文件格式: {file_path}")
         
-        # 提取文本
-        text = extractor(file_path)
-        if not text or not text.strip():
-            raise Exception("文件内容为空或无法提取文本")
-        
-        print(f"成功提取文本，长度: {len(text)}")
-        
-        # 检测语言
-        language = detect_language(text)
-        print(f"检测到语言: {language}")
-        
-        # 生成总结
         display_name = original_filename if original_filename else os.path.basename(file_path)
-        summary = summarize_and_interpret(text, language, display_name)
+        cache = get_document_cache() if use_cache else None
+        summary = None
+        reasoning = parse_reasoning_override(reasoning)
+        if cache is not None:
+            text_key, summary_key = document_cache_keys(file_sha256(file_path), display_name, reasoning)
+            summary = cache_get(cache, summary_key)
+        
+        if summary is not None:
+            print("命中解读结果缓存，直接生成Word文档")
+            if on_token is not None:
+                on_token('answer', summary)
+        else:
+            cached_text = cache_get(cache, text_key) if cache is not None else None
+            compaction_stats = {}
+            if cached_text is not None:
+                print("命中提取文本缓存，跳过文本提取")
+                units = [make_unit('document', 1, cached_text)]
+            else:
+                units = extractor(file_path)
+                # 缓存中的文本已经压缩过，只压缩新提取的文本
+                if ENABLE_PROMPT_COMPACTION:
+                    units = compact_units(units, compaction_stats)
+            
+            # 边提取边准备总结输入，超长文本在提取过程中即开始分块总结
+            text, sample, char_count = prepare_summary_input(units, display_name)
+            if not text or not text.strip():
+                raise Exception("文件内容为空或无法提取文本")
+            
+            print(f"成功提取文本，长度: {char_count}")
+            if compaction_stats:
+                print(format_compaction_stats(compaction_stats))
+            # 未切换为分块总结时返回的就是完整提取文本，可以缓存；超长文档的分块摘要另有缓存
+            if cache is not None and cached_text is None and len(text) == char_count:
+                cache_set(cache, text_key, text)
+            
+            # 检测语言
+            language = detect_language(sample)
+            print(f"检测到语言: {language}")
+            
+            # 按原文长度（而非分块摘要长度）和文档类型选择思考预算
+            source_tokens = estimate_tokens(sample) * char_count // max(1, len(sample))
+            reasoning_body = choose_reasoning(source_tokens, display_name, reasoning)
+            print(f"思考设置: {reasoning_body}（估算 {source_tokens} tokens）")
+            
+            # 生成总结
+            summary = summarize_and_interpret(text, language, display_name, on_token, reasoning_body)
+            if cache is not None and summary:
+                cache_set(cache, summary_key, summary)
         
         # 保存结果
         name_for_output = original_filename if original_filename else os.path.basename(file_path)
@@ -0,0 +1,135 @@
+"""
+推理客户端模块
+为PDF解析和文档解读提供进程内共享的OpenAI兼容客户端：
+- 所有模块复用同一个长连接池，避免每次处理都重新建立连接和TLS握手
+- 连接池大小、保活时间和超时均可配置，安装了h2时启用HTTP/2
+- 统计正在进行的请求数，报告连接池利用率
+"""
+import threading
+import importlib.util
+import httpx
+from openai import OpenAI
+
+# 推理服务配置
+INFERENCE_BASE_URL = 'https://api-inference.modelscope.cn/v1/'
+INFERENCE_API_KEY = 'your_api_key'
+
+# 连接池配置
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+KEEPALIVE_EXPIRY = 60  # 空闲连接保留时间（秒）
+CONNECT_TIMEOUT = 10  # 建立连接超时（秒）
+READ_TIMEOUT = 600  # 读取响应超时（秒），思考模式的长回答需要较长时间
+# 是否启用HTTP/2（需要安装 h2，未安装时自动使用HTTP/1.1）
+ENABLE_HTTP2 = True
+
+_client = None
+_client_lock = threading.Lock()
+
+class _PoolStats:
+    """统计经过连接池的请求数量与并发占用"""
+
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+            self.total_requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'total_requests': self.total_requests,
+                'max_connections': self.max_connections,
+                'utilization': round(self.in_flight / self.max_connections, 3),
+                'peak_utilization': round(self.peak_in_flight / self.max_connections, 3),
+            }
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """包装响应体，在响应读取完毕并关闭时归还占用计数（流式响应同样适用）"""
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close()
+
+class _TrackedTransport(httpx.HTTPTransport):
+    """记录连接占用情况的HTTP传输层"""
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request):
+        self._stats.acquire()
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            self._stats.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, self._stats.release)
+        return response
+
+_pool_stats = _PoolStats(MAX_CONNECTIONS)
+
+def http2_available():
+    """判断当前环境能否启用HTTP/2"""
+    return ENABLE_HTTP2 and importlib.util.find_spec('h2') is not None
+
+def create_client():
+    """按当前配置创建带连接池的推理客户端"""
+    _pool_stats.max_connections = MAX_CONNECTIONS
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    transport = _TrackedTransport(_pool_stats, limits=limits, http2=http2_available())
+    http_client = httpx.Client(transport=transport, limits=limits, timeout=timeout)
+    return OpenAI(
+        base_url=INFERENCE_BASE_URL,
+        api_key=INFERENCE_API_KEY,
+        http_client=http_client,
+        timeout=timeout,
+        # 限流与重试统一由 rate_limiter 负责，避免SDK内部重试掩盖429
+        max_retries=0,
+    )
+
+def get_client():
+    """获取进程内共享的推理客户端（首次使用时创建）"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = create_client()
+            print(f"推理客户端已创建: 最大连接数 {MAX_CONNECTIONS}，HTTP/2 {'启用' if http2_available() else '未启用'}")
+        return _client
+
+def get_pool_stats():
+    """获取连接池使用情况：当前/峰值并发请求数及其占最大连接数的比例"""
+    stats = _pool_stats.snapshot()
+    stats['http2'] = http2_available()
+    return stats
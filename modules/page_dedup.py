@@ -0,0 +1,108 @@
+"""
+页面去重模块
+识别同一任务中重复出现的页面，例如封面、章节分隔页、免责声明等模板页：
+- 对渲染后的页面图片计算256位差值哈希（dHash），用于快速筛选候选页面
+- 感知哈希无法区分版式相同、内容不同的页面（例如同一模板的表格页），候选页面还要在较高分辨率下逐像素比对确认
+- 索引只在单个处理任务内使用，不同用户、不同任务之间不共享页面描述
+"""
+import io
+import zlib
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageChops
+
+HASH_SIZE = 16  # 哈希边长，哈希位数为 HASH_SIZE * HASH_SIZE
+# 汉明距离不超过该值的页面作为候选，再经逐像素比对确认
+MAX_HASH_DISTANCE = 10
+# 索引最多保留的页面数，超出后淘汰最久未命中的条目
+MAX_INDEX_ENTRIES = 500
+
+# 逐像素比对：页面缩放到 VERIFY_WIDTH 宽（不放大）的灰度图，灰度差超过 VERIFY_PIXEL_DELTA 的像素不超过
+# VERIFY_MAX_CHANGED_PIXELS 个时才确认为重复页；表格中改动一个数字也会超过该阈值
+VERIFY_WIDTH = 1200
+VERIFY_PIXEL_DELTA = 48
+VERIFY_MAX_CHANGED_PIXELS = 0
+# 每次查找最多逐像素比对的候选页面数（同一模板的页面哈希往往相同，候选可能很多），优先比对距离近、最近登记的页面
+VERIFY_MAX_CANDIDATES = 16
+
+def open_page_image(image, size):
+    """打开页面图片（PIL Image或编码后的图片字节），JPEG在解码阶段直接缩小到接近 size"""
+    if isinstance(image, bytes):
+        image = Image.open(io.BytesIO(image))
+        image.draft('L', size)
+    return image
+
+def perceptual_hash(image, hash_size=HASH_SIZE):
+    """计算图片（PIL Image或编码后的图片字节）的差值哈希，返回整数"""
+    # JPEG在解码阶段直接缩小，避免解码整页
+    image = open_page_image(image, (hash_size * 8, hash_size * 8))
+    pixels = image.convert('L').resize((hash_size + 1, hash_size), Image.BOX).tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hash_distance(hash_a, hash_b):
+    """两个哈希之间的汉明距离"""
+    return bin(hash_a ^ hash_b).count('1')
+
+def page_fingerprint(image, width=VERIFY_WIDTH):
+    """生成用于逐像素比对的页面指纹：(尺寸, 压缩后的灰度像素)"""
+    image = open_page_image(image, (width, width * 2))
+    # 小于比对宽度的页面按原尺寸比对，不放大
+    width = min(width, image.width)
+    height = max(1, round(image.height * width / image.width))
+    gray = image.convert('L').resize((width, height), Image.BILINEAR)
+    return gray.size, zlib.compress(gray.tobytes(), 1)
+
+def fingerprints_match(fingerprint_a, fingerprint_b):
+    """逐像素比对两个页面指纹，明显不同的像素不超过 VERIFY_MAX_CHANGED_PIXELS 个时返回True"""
+    size_a, data_a = fingerprint_a
+    size_b, data_b = fingerprint_b
+    if size_a != size_b:
+        return False
+    if data_a == data_b:
+        return True
+    diff = ImageChops.difference(Image.frombytes('L', size_a, zlib.decompress(data_a)),
+                                 Image.frombytes('L', size_b, zlib.decompress(data_b)))
+    changed = diff.point(lambda value: 255 if value > VERIFY_PIXEL_DELTA else 0).histogram()[255]
+    return changed <= VERIFY_MAX_CHANGED_PIXELS
+
+class PageHashIndex:
+    """单个任务内的页面哈希索引：按汉明距离筛选候选页面，逐像素比对确认后才复用已有描述"""
+
+    def __init__(self, max_distance=MAX_HASH_DISTANCE, max_entries=MAX_INDEX_ENTRIES):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def find(self, page_hash, fingerprint):
+        """按哈希距离由近到远比对候选页面，返回第一个逐像素确认重复的 (内容, 来源信息)，没有时返回None"""
+        with self._lock:
+            # 同一任务中相同的页面渲染结果一致，指纹完全相同时直接命中
+            key = (page_hash, fingerprint)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            candidates = sorted(
+                (distance, -index, key) for index, key in enumerate(self._entries)
+                for distance in [hash_distance(page_hash, key[0])] if distance <= self.max_distance
+            )
+            for _, _, key in candidates[:VERIFY_MAX_CANDIDATES]:
+                if fingerprints_match(fingerprint, key[1]):
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+            return None
+
+    def add(self, page_hash, fingerprint, content, source):
+        """登记已分析页面的哈希、比对指纹、描述与来源；同一模板的页面哈希往往相同，按哈希和指纹共同区分"""
+        key = (page_hash, fingerprint)
+        with self._lock:
+            self._entries[key] = (content, source)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
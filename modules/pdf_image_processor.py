@@ -2,65 +2,252 @@ import os
 import base64
 import json
 import pandas as pd
-from openai import OpenAI
-from pdf2image import convert_from_path
+import pdfplumber
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 import io
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from docx import Document
 from docx.shared import Inches
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.opc.constants import RELATIONSHIP_TYPE
+from modules.result_cache import ResultCache, make_cache_key, file_sha256, cache_get, cache_set, DEFAULT_CACHE_DIR
+from modules.inference_client import get_client, get_pool_stats
+from modules.rate_limiter import get_limiter
+from modules.request_policy import get_call_policy
+from modules.page_dedup import PageHashIndex, perceptual_hash, page_fingerprint
 
 # 配置参数
 MODEL_ID = "Qwen/Qwen2.5-VL-72B-Instruct"
+# 模型分级：信息简单的页面先交给小模型，需要时再升级到 MODEL_ID；关闭时所有页面都使用 MODEL_ID
+ENABLE_MODEL_CASCADE = True
+SMALL_MODEL_ID = "Qwen/Qwen2.5-VL-7B-Instruct"
+# 以下页面直接使用大模型：检测到表格；没有文字层（扫描页、整页图片或矢量图形，其中的表格和图表
+# 在文字层特征中不可见）；图片面积占比超过 CASCADE_MAX_IMAGE_RATIO（扫描页、图文混排的图表和插图页）；
+# 编码后图片超过 CASCADE_SMALL_MAX_BYTES（信息密集）
+CASCADE_MAX_IMAGE_RATIO = 0.3
+CASCADE_SMALL_MAX_BYTES = 300 * 1024
+# 小模型回答的校验：字符数过少、出现拒答用语或同一行反复出现时，升级到大模型重新分析
+CASCADE_MIN_OUTPUT_CHARS = 50
+CASCADE_MAX_REPEATED_LINES = 5
+CASCADE_REFUSAL_PATTERN = re.compile(r'无法识别|无法辨认|看不清|抱歉|sorry|unable to|cannot', re.IGNORECASE)
 
-def pdf_to_images(pdf_path, output_dir=None):
-    """将PDF转换为图片列表"""
+# 同时向模型发起的页面分析请求数上限，设为1时退化为逐页串行处理
+MAX_CONCURRENT_PAGES = 4
+# 流式渲染时每次交给poppler渲染的页数，内存占用随该值而非总页数增长
+RENDER_WINDOW_SIZE = 4
+# 并行渲染的进程数，按页码区间分片到各进程；设为1时在当前进程内串行渲染
+RENDER_WORKERS = 1
+
+# 发送给模型的页面图片参数：每页只编码一次，同一份字节既写入磁盘也作为请求体
+# 长边像素上限（None表示保持渲染分辨率）、编码格式（JPEG/WEBP）、压缩质量、是否转为灰度
+PAYLOAD_MAX_LONG_EDGE = 1600
+PAYLOAD_FORMAT = 'JPEG'
+PAYLOAD_QUALITY = 85
+PAYLOAD_GRAYSCALE = False
+
+PAYLOAD_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+PAYLOAD_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+# 多页合并请求：连续的低信息密度页面（编码后图片不超过 PAGE_BATCH_MAX_BYTES）每 PAGE_BATCH_SIZE 页
+# 合并为一次多图请求，减少请求次数与重复的提示词开销；设为1时关闭
+PAGE_BATCH_SIZE = 1
+PAGE_BATCH_MAX_BYTES = 150 * 1024
+
+# 重复页复用：同一上传任务内（可跨多个PDF）与已分析页面逐像素确认重复的页面直接复用已有描述；关闭时每页都单独分析
+ENABLE_PAGE_DEDUP = True
+
+# Word导出时页面图片的处理方式：
+# 'thumbnail' 嵌入缩略图（默认），'full' 嵌入原图，'none' 不嵌入图片只保留指向图片文件的链接
+DOCX_IMAGE_MODE = 'thumbnail'
+DOCX_THUMBNAIL_LONG_EDGE = 800
+DOCX_THUMBNAIL_QUALITY = 70
+
+# 页面描述缓存：以页面图片字节、模型ID和提示词的哈希为键，重复上传的页面无需再次调用模型
+PAGE_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, 'page_descriptions.db')
+PAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# 文字层快速通道：原生文字充足且图片占比较小的页面直接本地提取文本和表格，不调用模型
+TEXT_LAYER_MIN_CHARS = 200
+TEXT_LAYER_MAX_IMAGE_RATIO = 0.3
+# 无法映射到Unicode的字符（如 "(cid:123)"）占比超过该值时视为文字层不可用
+TEXT_LAYER_MAX_CID_RATIO = 0.05
+
+PAGE_ANALYSIS_PROMPT = '详细描述这幅图中的所有内容，包括文本、图表、图像元素等，直接介绍具体内容。如果存在表格，额外将表格输出为markdown的格式。要求表头准确清晰，注意表头的层级结构内容完整且对应无误，请确保表格内容准确对应到相应列，表格内容不要翻译。'
+
+BATCH_ANALYSIS_PROMPT = '下面依次给出同一文档的{count}页图片。请逐页处理，每一页的要求是：' + PAGE_ANALYSIS_PROMPT + \
+    '\n每一页的输出前单独占一行写“=== 第K页 ===”，K为该页在本次给出的图片中的序号（从1开始），不要合并或遗漏任何一页。'
+BATCH_PAGE_HEADER = re.compile(r'^\s*=+\s*第\s*(\d+)\s*页\s*=+\s*$', re.MULTILINE)
+
+# 同一进度字典可能被多个PDF处理线程同时更新
+_progress_lock = threading.Lock()
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+def get_page_cache():
+    """获取进程内共享的页面描述缓存（首次使用时创建）"""
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = ResultCache(PAGE_CACHE_PATH, PAGE_CACHE_MAX_BYTES)
+        return _page_cache
+
+def get_pdf_page_count(pdf_path):
+    """获取PDF总页数（只读取文档信息，不渲染页面）"""
+    return int(pdfinfo_from_path(pdf_path)['Pages'])
+
+def get_payload_options():
+    """根据当前配置生成页面编码参数（显式传入渲染进程，避免子进程读取到默认值）"""
+    return {
+        'max_long_edge': PAYLOAD_MAX_LONG_EDGE,
+        'image_format': PAYLOAD_FORMAT,
+        'quality': PAYLOAD_QUALITY,
+        'grayscale': PAYLOAD_GRAYSCALE,
+    }
+
+def page_image_name(pdf_filename, page_num, image_format='JPEG'):
+    """生成页面图片文件名"""
+    return f"{os.path.splitext(os.path.basename(pdf_filename))[0]}_page_{page_num}.{PAYLOAD_EXTENSIONS[image_format]}"
+
+def encode_page(image, max_long_edge=PAYLOAD_MAX_LONG_EDGE, image_format=PAYLOAD_FORMAT,
+                quality=PAYLOAD_QUALITY, grayscale=PAYLOAD_GRAYSCALE):
+    """按长边上限缩放页面图片并编码一次，返回图片字节"""
+    if grayscale:
+        image = image.convert('L')
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    
+    if max_long_edge and max(image.size) > max_long_edge:
+        scale = max_long_edge / max(image.size)
+        new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(new_size, Image.LANCZOS)
+    
+    buffered = io.BytesIO()
+    image.save(buffered, format=image_format, quality=quality)
+    return buffered.getvalue()
+
+def _render_window(pdf_path, first_page, last_page, output_dir=None, payload_options=None):
+    """渲染指定页码区间
+    
+    指定 payload_options 时每页编码一次并返回图片字节（指定输出目录时同一份字节直接落盘）；
+    否则返回图片列表，指定输出目录时落盘并返回图片路径。
+    """
+    images = convert_from_path(pdf_path, first_page=first_page, last_page=last_page)
+    if payload_options is not None:
+        payloads = []
+        for page_num, image in enumerate(images, first_page):
+            payload = encode_page(image, **payload_options)
+            image.close()
+            if output_dir:
+                image_name = page_image_name(pdf_path, page_num, payload_options['image_format'])
+                with open(os.path.join(output_dir, image_name), 'wb') as f:
+                    f.write(payload)
+            payloads.append(payload)
+        return payloads
+    
+    if not output_dir:
+        return images
+    
+    # 在渲染进程内保存图片，避免跨进程传输整页位图
+    image_paths = []
+    for page_num, image in enumerate(images, first_page):
+        image_path = os.path.join(output_dir, page_image_name(pdf_path, page_num))
+        image.save(image_path, "JPEG")
+        image.close()
+        image_paths.append(image_path)
+    return image_paths
+
+def iter_pdf_pages(pdf_path, output_dir=None, window_size=RENDER_WINDOW_SIZE, page_count=None,
+                   render_workers=RENDER_WORKERS, payload_options=None, skip_pages=None):
+    """按窗口逐段渲染PDF，每渲染完一页即按页码顺序产出 (页码, 图片、图片路径或编码后的图片字节)
+    
+    skip_pages 中的页码不会产出，全部页码都被跳过的窗口不会渲染。
+    """
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # 转换PDF为图片
-    images = convert_from_path(pdf_path)
+    if page_count is None:
+        page_count = get_pdf_page_count(pdf_path)
+    window_size = max(1, window_size)
+    skip_pages = skip_pages or set()
+    windows = [
+        (first_page, min(first_page + window_size - 1, page_count))
+        for first_page in range(1, page_count + 1, window_size)
+    ]
+    windows = [
+        (first_page, last_page) for first_page, last_page in windows
+        if any(page_num not in skip_pages for page_num in range(first_page, last_page + 1))
+    ]
     
-    # 如果指定了输出目录，则保存图片
-    if output_dir:
-        image_paths = []
-        pdf_filename = os.path.splitext(os.path.basename(pdf_path))[0]
-        for i, image in enumerate(images):
-            image_name = f"{pdf_filename}_page_{i+1}.jpg"
-            image_path = os.path.join(output_dir, image_name)
-            image.save(image_path, "JPEG")
-            image_paths.append(image_path)
-        return image_paths
+    if render_workers <= 1 or len(windows) <= 1:
+        for first_page, last_page in windows:
+            pages = enumerate(_render_window(pdf_path, first_page, last_page, output_dir, payload_options), first_page)
+            yield from ((page_num, page) for page_num, page in pages if page_num not in skip_pages)
+        return
     
-    return images
+    # 多进程分片渲染：最多同时提交 2 倍进程数的窗口，按提交顺序取回以保证页码有序
+    with ProcessPoolExecutor(max_workers=render_workers) as executor:
+        pending = deque()
+        window_iter = iter(windows)
+        for first_page, last_page in window_iter:
+            pending.append((first_page, executor.submit(
+                _render_window, pdf_path, first_page, last_page, output_dir, payload_options)))
+            if len(pending) >= render_workers * 2:
+                break
+        
+        while pending:
+            first_page, future = pending.popleft()
+            next_window = next(window_iter, None)
+            if next_window:
+                pending.append((next_window[0], executor.submit(
+                    _render_window, pdf_path, *next_window, output_dir, payload_options)))
+            pages = enumerate(future.result(), first_page)
+            yield from ((page_num, page) for page_num, page in pages if page_num not in skip_pages)
 
-def image_to_base64(image):
-    """将PIL Image对象或图片路径转换为Base64编码"""
+def pdf_to_images(pdf_path, output_dir=None):
+    """将PDF转换为图片列表"""
+    return [image for _, image in iter_pdf_pages(pdf_path, output_dir)]
+
+def image_to_bytes(image):
+    """将PIL Image对象或图片路径转换为JPEG字节，已是字节时原样返回"""
+    if isinstance(image, bytes):
+        return image
     if isinstance(image, str):
         if not os.path.exists(image):
             raise FileNotFoundError(f"图片文件不存在: {image}")
         with open(image, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode('utf-8')
+            return img_file.read()
     
     # 处理PIL Image对象
     buffered = io.BytesIO()
     image.save(buffered, format="JPEG")
-    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+    return buffered.getvalue()
 
-def analyze_image_with_model(client, image, model_id=MODEL_ID):
-    """使用多模态模型分析图片内容"""
+def image_to_base64(image):
+    """将PIL Image对象、图片路径或图片字节转换为Base64编码"""
+    return base64.b64encode(image_to_bytes(image)).decode('utf-8')
+
+def analyze_image_with_model(client, image, model_id=MODEL_ID, mime_type='image/jpeg'):
+    """使用多模态模型分析图片内容（经共享限流器调用，被限流、超时时自动重试，耗时过长时发送对冲请求）"""
     image_base64 = image_to_base64(image)
     
-    response = client.chat.completions.create(
+    response = get_call_policy('page').call(
+        client.chat.completions.create,
         model=model_id,
         messages=[{
             'role': 'user',
             'content': [{
                 'type': 'text',
-                'text': '详细描述这幅图中的所有内容，包括文本、图表、图像元素等，直接介绍具体内容。如果存在表格，额外将表格输出为markdown的格式。要求表头准确清晰，注意表头的层级结构内容完整且对应无误，请确保表格内容准确对应到相应列，表格内容不要翻译。',
+                'text': PAGE_ANALYSIS_PROMPT,
             }, {
                 'type': 'image_url',
                 'image_url': {
-                    'url': f'data:image/jpeg;base64,{image_base64}'
+                    'url': f'data:{mime_type};base64,{image_base64}'
                 },
             }],
         }]
@@ -68,52 +255,386 @@ def analyze_image_with_model(client, image, model_id=MODEL_ID):
     
     return response.choices[0].message.content
 
-def json_to_docx(results, output_dir, pdf_name):
-    """将JSON格式的结果转换为Word文档"""
+def split_batch_response(text, count):
+    """按“=== 第K页 ===”分隔行把多页回答拆分为逐页内容，页数对不上时抛出ValueError"""
+    headers = list(BATCH_PAGE_HEADER.finditer(text))
+    contents = {}
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        contents[int(header.group(1))] = text[header.end():end].strip()
+    if sorted(contents) != list(range(1, count + 1)):
+        raise ValueError(f"批量回答无法拆分为 {count} 页，识别到的页序号: {sorted(contents)}")
+    return [contents[k] for k in range(1, count + 1)]
+
+def analyze_images_with_model(client, images, model_id=MODEL_ID, mime_type='image/jpeg'):
+    """在一次请求中分析多张页面图片，返回与输入顺序一致的逐页内容"""
+    content = [{'type': 'text', 'text': BATCH_ANALYSIS_PROMPT.format(count=len(images))}]
+    for k, image in enumerate(images, 1):
+        content.append({'type': 'text', 'text': f'第{k}页：'})
+        content.append({
+            'type': 'image_url',
+            'image_url': {
+                'url': f'data:{mime_type};base64,{image_to_base64(image)}'
+            },
+        })
+    
+    response = get_call_policy('page_batch').call(
+        client.chat.completions.create,
+        model=model_id,
+        messages=[{'role': 'user', 'content': content}]
+    )
+    return split_batch_response(response.choices[0].message.content, len(images))
+
+def make_docx_thumbnail(image_path, long_edge=DOCX_THUMBNAIL_LONG_EDGE, quality=DOCX_THUMBNAIL_QUALITY):
+    """生成用于嵌入Word的JPEG缩略图（同时把Word不支持的WebP转为JPEG）"""
+    with Image.open(image_path) as image:
+        # JPEG在解码阶段直接按2的幂缩小，省去大部分解码开销
+        image.draft('RGB', (long_edge, long_edge))
+        image.thumbnail((long_edge, long_edge), Image.LANCZOS)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        picture = io.BytesIO()
+        image.save(picture, format='JPEG', quality=quality)
+    picture.seek(0)
+    return picture
+
+def load_docx_picture(image_path, image_mode):
+    """按导出模式读取要嵌入Word的图片，'full' 模式下只有WebP需要转换"""
+    if not os.path.exists(image_path):
+        return None
+    if image_mode == 'thumbnail' or image_path.lower().endswith('.webp'):
+        long_edge = DOCX_THUMBNAIL_LONG_EDGE if image_mode == 'thumbnail' else 100000
+        return make_docx_thumbnail(image_path, long_edge)
+    return image_path
+
+def add_hyperlink(paragraph, url, text):
+    """在段落末尾添加外部超链接"""
+    r_id = paragraph.part.relate_to(url, RELATIONSHIP_TYPE.HYPERLINK, is_external=True)
+    hyperlink = OxmlElement('w:hyperlink')
+    hyperlink.set(qn('r:id'), r_id)
+    run = OxmlElement('w:r')
+    run_properties = OxmlElement('w:rPr')
+    underline = OxmlElement('w:u')
+    underline.set(qn('w:val'), 'single')
+    run_properties.append(underline)
+    run.append(run_properties)
+    run_text = OxmlElement('w:t')
+    run_text.text = text
+    run.append(run_text)
+    hyperlink.append(run)
+    paragraph._p.append(hyperlink)
+
+def json_to_docx(results, output_dir, pdf_name, image_mode=None):
+    """将JSON格式的结果转换为Word文档
+    
+    image_mode 为 'thumbnail' 时嵌入缩略图，'full' 时嵌入原图，'none' 时只写入图片链接；
+    缩略图在后台线程中预先生成，与文档组装重叠进行。
+    """
+    image_mode = image_mode or DOCX_IMAGE_MODE
+    image_width = Inches(6) if image_mode == 'full' else Inches(4)
     doc = Document()
     doc.add_heading(f'{pdf_name} 内容提取结果', 0)
     
-    for result in results:
-        page_num = result['page_number']
-        doc.add_heading(f'{pdf_name} 第 {page_num} 页', level=1)
-        
-        # 添加图片（如果有）
-        if 'image_name' in result and result['image_name']:
-            image_path = os.path.join(output_dir, "images", result['image_name'])
-            if os.path.exists(image_path):
-                try:
-                    doc.add_picture(image_path, width=Inches(6))
-                except Exception as e:
-                    doc.add_paragraph(f"[无法添加图片: {str(e)}]")
-            else:
-                doc.add_paragraph(f"[图片文件不存在: {image_path}]")
-        
-        # 添加内容
-        if 'error' in result:
-            doc.add_paragraph(f"处理错误: {result['error']}")
+    image_paths = [
+        os.path.join(output_dir, "images", result['image_name']) if result.get('image_name') else None
+        for result in results
+    ]
+    
+    def load_picture(image_path):
+        # 以返回值带回异常，避免单张图片出错中断整个导出
+        if not image_path:
+            return None
+        try:
+            return load_docx_picture(image_path, image_mode)
+        except Exception as e:
+            return e
+    
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        if image_mode == 'none':
+            pictures = [None] * len(results)
         else:
-            doc.add_paragraph(result['content'])
+            pictures = executor.map(load_picture, image_paths)
         
-        # 添加分页符（除了最后一页）
-        if page_num < len(results):
-            doc.add_page_break()
+        for index, (result, image_path, picture) in enumerate(zip(results, image_paths, pictures)):
+            page_num = result['page_number']
+            doc.add_heading(f'{pdf_name} 第 {page_num} 页', level=1)
+            
+            # 添加图片（如果有）
+            if image_path:
+                if image_mode == 'none':
+                    if os.path.exists(image_path):
+                        add_hyperlink(doc.add_paragraph("页面图片: "), f"images/{result['image_name']}", result['image_name'])
+                    else:
+                        doc.add_paragraph(f"[图片文件不存在: {image_path}]")
+                elif isinstance(picture, Exception):
+                    doc.add_paragraph(f"[无法添加图片: {str(picture)}]")
+                elif picture is None:
+                    doc.add_paragraph(f"[图片文件不存在: {image_path}]")
+                else:
+                    try:
+                        doc.add_picture(picture, width=image_width)
+                    except Exception as e:
+                        doc.add_paragraph(f"[无法添加图片: {str(e)}]")
+            
+            # 添加内容
+            if 'error' in result:
+                doc.add_paragraph(f"处理错误: {result['error']}")
+            else:
+                doc.add_paragraph(result['content'])
+            
+            # 添加分页符（除了最后一页）
+            if index < len(results) - 1:
+                doc.add_page_break()
     
     # 保存文档
     output_path = os.path.join(output_dir, f"{os.path.splitext(pdf_name)[0]}_extracted.docx")
     doc.save(output_path)
     print(f"Word文档已保存至: {output_path}")
 
-def process_pdf(pdf_path, output_dir=None, progress=None):
-    """处理单个PDF文件，将其转换为图片并提取文本内容"""
+def get_journal_path(output_dir, pdf_filename):
+    """页面处理日志（JSONL）路径"""
+    return os.path.join(output_dir, f"{os.path.splitext(pdf_filename)[0]}_journal.jsonl")
+
+def load_journal(journal_path, pdf_hash):
+    """读取断点日志中已成功完成的页面结果，日志属于其他文件或不存在时返回空字典"""
+    if not os.path.exists(journal_path):
+        return {}
+    
+    completed = {}
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        header = f.readline()
+        try:
+            if json.loads(header).get('pdf_sha256') != pdf_hash:
+                print(f"断点日志与当前文件不匹配，重新处理: {journal_path}")
+                return {}
+        except ValueError:
+            return {}
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # 进程中断时最后一行可能只写了一半
+                continue
+            if 'error' not in result:
+                completed[result['page_number']] = result
+    return completed
+
+def open_journal(journal_path, pdf_hash, completed):
+    """打开断点日志用于追加；没有可续传的结果时重写日志头"""
+    if completed:
+        return open(journal_path, 'a', encoding='utf-8')
+    journal = open(journal_path, 'w', encoding='utf-8')
+    journal.write(json.dumps({'pdf_sha256': pdf_hash}) + '\n')
+    journal.flush()
+    return journal
+
+def make_page_result(page_num, image_name, pdf_filename, content=None, error=None, route='vlm', model=None):
+    """生成单页结果条目，route 记录该页的处理方式：模型分析(vlm)、文字层提取(text_layer)或复用重复页(dedup)，
+    model 记录实际给出结果的模型"""
+    result = {
+        "page_number": page_num,
+        "image_name": image_name,
+    }
+    if error is not None:
+        result["error"] = error
+    else:
+        result["content"] = content
+    if model is not None:
+        result["model"] = model
+    result.update({
+        "route": route,
+        "source_pdf": pdf_filename,
+        "timestamp": str(pd.Timestamp.now())
+    })
+    return result
+
+def table_to_markdown(table):
+    """将pdfplumber提取的表格（行列表）转换为markdown表格"""
+    rows = [
+        [str(cell).replace('|', '\\|').replace('\n', '<br>') if cell is not None else '' for cell in row]
+        for row in table if row
+    ]
+    if not rows:
+        return ''
+    col_count = max(len(row) for row in rows)
+    rows = [row + [''] * (col_count - len(row)) for row in rows]
+    lines = ['| ' + ' | '.join(rows[0]) + ' |', '| ' + ' | '.join(['---'] * col_count) + ' |']
+    lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+    return '\n'.join(lines)
+
+def classify_page(page):
+    """根据文字层字符数量与图片面积占比判断页面走文字层提取还是模型分析"""
+    page_area = float(page.width * page.height) or 1.0
+    chars = page.chars
+    cid_chars = sum(1 for char in chars if char.get('text', '').startswith('(cid:'))
+    
+    image_area = 0.0
+    for image in page.images:
+        # 按页面边界裁剪，避免出血图片面积超过整页
+        x0, x1 = max(image['x0'], 0), min(image['x1'], page.width)
+        top, bottom = max(image['top'], 0), min(image['bottom'], page.height)
+        image_area += max(x1 - x0, 0) * max(bottom - top, 0)
+    
+    features = {
+        'char_count': len(chars),
+        'image_ratio': min(image_area / page_area, 1.0),
+        'cid_ratio': cid_chars / max(len(chars), 1),
+    }
+    is_native_text = (
+        features['char_count'] >= TEXT_LAYER_MIN_CHARS
+        and features['image_ratio'] <= TEXT_LAYER_MAX_IMAGE_RATIO
+        and features['cid_ratio'] <= TEXT_LAYER_MAX_CID_RATIO
+    )
+    features['route'] = 'text_layer' if is_native_text else 'vlm'
+    return features
+
+def extract_page_text_layer(page):
+    """从原生文字页提取文本，并将检测到的表格追加为markdown格式"""
+    content = page.extract_text() or ''
+    tables = [table_to_markdown(table) for table in page.extract_tables()]
+    tables = [table for table in tables if table]
+    if tables:
+        content += '\n\n' + '\n\n'.join(tables)
+    return content
+
+def inspect_page(plumber_pdf, page_num):
+    """读取页面特征，原生文字页同时提取文字层内容，返回 (特征, 文字层内容)；需要模型分析的页面内容为None"""
+    page = plumber_pdf.pages[page_num - 1]
+    try:
+        features = classify_page(page)
+        if features['route'] == 'text_layer':
+            return features, extract_page_text_layer(page)
+        # 只对需要模型分析的页面检测表格，供模型分级使用
+        features['table_count'] = len(page.find_tables())
+        return features, None
+    except Exception as e:
+        print(f"第 {page_num} 页文字层读取失败，改用模型分析: {str(e)}")
+        return None, None
+    finally:
+        # 释放页面解析缓存，避免大文档的版面对象全部驻留内存
+        page.close()
+
+def select_model(features, payload_size):
+    """根据页面特征和编码后图片大小选择模型，返回模型ID；没有文字层特征时只按图片大小判断"""
+    if not ENABLE_MODEL_CASCADE or payload_size > CASCADE_SMALL_MAX_BYTES:
+        return MODEL_ID
+    if features:
+        if features.get('table_count'):
+            return MODEL_ID
+        # 表格检测只覆盖文字层，栅格化的表格和图表只能按是否有文字层、图片面积判断
+        if features['char_count'] == 0 or features['image_ratio'] > CASCADE_MAX_IMAGE_RATIO:
+            return MODEL_ID
+    return SMALL_MODEL_ID
+
+def validate_page_content(content):
+    """校验小模型的回答，返回不合格的原因，合格时返回None"""
+    text = (content or '').strip()
+    if len(text) < CASCADE_MIN_OUTPUT_CHARS:
+        return f"回答过短（{len(text)} 字符）"
+    if CASCADE_REFUSAL_PATTERN.search(text[:200]):
+        return "回答包含拒答用语"
+    lines = [line.strip() for line in text.splitlines() if line.strip() and not set(line.strip()) <= set('|-: ')]
+    if lines and max(lines.count(line) for line in set(lines)) > CASCADE_MAX_REPEATED_LINES:
+        return "回答出现重复循环"
+    return None
+
+def analyze_page(client, image, page_num, pdf_filename, images_output_dir=None, cache=None,
+                 image_format='JPEG', features=None):
+    """分析单页图片并生成结果条目，优先读取缓存，出错时返回包含错误信息的条目
+    
+    启用模型分级时按页面特征先选用小模型，回答未通过校验再用大模型重新分析。
+    """
+    print(f"正在处理第 {page_num} 页...")
+    image_name = page_image_name(pdf_filename, page_num, image_format) if images_output_dir else None
+    
+    try:
+        image_bytes = image_to_bytes(image)
+        model_id = select_model(features, len(image_bytes))
+        # 小模型可以复用大模型的缓存结果，反之不行；只有通过校验的小模型回答才会写入缓存
+        candidates = [model_id] if model_id == MODEL_ID else [model_id, MODEL_ID]
+        if cache is not None:
+            for candidate in candidates:
+                page_content = cache_get(cache, make_cache_key(image_bytes, candidate, PAGE_ANALYSIS_PROMPT))
+                if page_content is not None:
+                    print(f"第 {page_num} 页命中缓存")
+                    return make_page_result(page_num, image_name, pdf_filename, content=page_content, model=candidate)
+        
+        mime_type = PAYLOAD_MIME_TYPES[image_format]
+        page_content = analyze_image_with_model(client, image_bytes, model_id=model_id, mime_type=mime_type)
+        if model_id != MODEL_ID:
+            reason = validate_page_content(page_content)
+            if reason is not None:
+                print(f"第 {page_num} 页小模型{reason}，升级到 {MODEL_ID}")
+                model_id = MODEL_ID
+                page_content = analyze_image_with_model(client, image_bytes, model_id=model_id, mime_type=mime_type)
+        if cache is not None:
+            cache_set(cache, make_cache_key(image_bytes, model_id, PAGE_ANALYSIS_PROMPT), page_content)
+        return make_page_result(page_num, image_name, pdf_filename, content=page_content, model=model_id)
+    except Exception as e:
+        print(f"处理第 {page_num} 页时出错: {str(e)}")
+        return make_page_result(page_num, image_name, pdf_filename, error=str(e))
+
+def analyze_page_batch(client, pages, pdf_filename, images_output_dir=None, cache=None, image_format='JPEG',
+                       page_features=None):
+    """合并分析多张连续页面并拆分回逐页结果；命中缓存的页面不再发送，合并请求失败时逐页重试
+    
+    合并请求固定使用大模型，小模型难以稳定地按页分隔多图回答。
+    """
+    page_nums = [page_num for page_num, _ in pages]
+    print(f"正在合并处理第 {page_nums[0]}-{page_nums[-1]} 页...")
+    results = {}
+    
+    uncached = []
+    for page_num, image in pages:
+        image_bytes = image_to_bytes(image)
+        cache_key = make_cache_key(image_bytes, MODEL_ID, PAGE_ANALYSIS_PROMPT) if cache is not None else None
+        page_content = cache_get(cache, cache_key)
+        if page_content is None:
+            uncached.append((page_num, image_bytes, cache_key))
+        else:
+            image_name = page_image_name(pdf_filename, page_num, image_format) if images_output_dir else None
+            results[page_num] = make_page_result(page_num, image_name, pdf_filename, content=page_content,
+                                                 model=MODEL_ID)
+    
+    if len(uncached) > 1:
+        try:
+            contents = analyze_images_with_model(client, [image_bytes for _, image_bytes, _ in uncached],
+                                                 mime_type=PAYLOAD_MIME_TYPES[image_format])
+            for (page_num, _, cache_key), page_content in zip(uncached, contents):
+                cache_set(cache, cache_key, page_content)
+                image_name = page_image_name(pdf_filename, page_num, image_format) if images_output_dir else None
+                results[page_num] = make_page_result(page_num, image_name, pdf_filename, content=page_content,
+                                                     model=MODEL_ID)
+            uncached = []
+        except Exception as e:
+            print(f"合并请求第 {page_nums[0]}-{page_nums[-1]} 页失败，改为逐页处理: {str(e)}")
+    
+    for page_num, image_bytes, _ in uncached:
+        results[page_num] = analyze_page(client, image_bytes, page_num, pdf_filename, images_output_dir, cache, image_format,
+                                         page_features.get(page_num) if page_features else None)
+    return [results[page_num] for page_num in page_nums]
+
+def create_page_index():
+    """为一次上传任务创建重复页索引，由该任务的各个PDF共享；未启用重复页复用时返回None"""
+    return PageHashIndex() if ENABLE_PAGE_DEDUP else None
+
+def process_pdf(pdf_path, output_dir=None, progress=None, max_concurrency=MAX_CONCURRENT_PAGES,
+                window_size=RENDER_WINDOW_SIZE, render_workers=RENDER_WORKERS, use_cache=True,
+                use_text_layer=True, batch_size=PAGE_BATCH_SIZE, use_dedup=ENABLE_PAGE_DEDUP, page_index=None):
+    """处理单个PDF文件，流式渲染页面并并发提取各页文本内容，结果按页码顺序返回
+    
+    原生文字页直接从文字层提取，只有扫描页或图片较多的页面才调用多模态模型。
+    指定输出目录时每完成一页即追加写入断点日志，中断后重新处理同一文件会跳过已完成的页面。
+    batch_size 大于1时，连续的低信息密度页面合并为一次多图请求。
+    启用去重时，与索引中已分析页面逐像素确认重复的页面直接复用已有描述，统计写入 progress['dedup']；
+    传入 page_index（见 create_page_index）时同一上传任务的多个PDF共享索引，否则只在本文件内去重。
+    """
     if progress:
         progress['currentFile'] = os.path.basename(pdf_path)
         progress['status'] = '正在处理'
     
-    # 初始化OpenAI客户端
-    client = OpenAI(
-        base_url='https://api-inference.modelscope.cn/v1/',
-        api_key='your_api_key',
-    )
+    # 使用共享的推理客户端，复用长连接
+    client = get_client()
     
     # 创建图片输出目录
     images_output_dir = None
@@ -122,56 +643,199 @@ def process_pdf(pdf_path, output_dir=None, progress=None):
         os.makedirs(images_output_dir, exist_ok=True)
     
     pdf_filename = os.path.basename(pdf_path)
+    cache = get_page_cache() if use_cache else None
+    payload_options = get_payload_options()
+    
+    # 获取页数后边渲染边分析，渲染与模型调用相互重叠
+    total_pages = get_pdf_page_count(pdf_path)
+    if progress:
+        with _progress_lock:
+            progress['total'] += total_pages
+    
+    results = [None] * total_pages
+    
+    # 读取断点日志，已完成的页面直接复用
+    journal = None
+    completed = {}
+    if output_dir:
+        journal_path = get_journal_path(output_dir, pdf_filename)
+        pdf_hash = file_sha256(pdf_path)
+        completed = {
+            page_num: result for page_num, result in load_journal(journal_path, pdf_hash).items()
+            if 1 <= page_num <= total_pages
+        }
+        journal = open_journal(journal_path, pdf_hash, completed)
+        if completed:
+            print(f"从断点日志恢复 {len(completed)} 页，剩余 {total_pages - len(completed)} 页")
+    for page_num, result in completed.items():
+        results[page_num - 1] = result
+    if progress and completed:
+        with _progress_lock:
+            progress['current'] += len(completed)
+    journal_lock = threading.Lock()
     
-    # 将PDF转换为图片
+    max_workers = max(1, min(max_concurrency or 1, total_pages or 1))
+    # 已渲染但尚未分析完成的页数上限，限制内存中驻留的图片数量
+    in_flight = threading.Semaphore(max_workers + window_size)
     print(f"正在将PDF转换为图片: {pdf_path}")
-    images = pdf_to_images(pdf_path, images_output_dir)
+    print(f"共 {total_pages} 页，并发数: {max_workers}")
     
-    # 处理每一页图片
-    results = []
-    total_pages = len(images)
+    # 重复页检测：记录各页的感知哈希与比对指纹，分析成功的页面登记到索引；索引只在同一上传任务内共享
+    if not use_dedup:
+        page_index = None
+    elif page_index is None:
+        page_index = PageHashIndex()
+    page_hashes = {}
+    page_fingerprints = {}
+    dedup_stats = {'checked': 0, 'duplicates': 0}
     if progress:
-        progress['total'] += total_pages
+        with _progress_lock:
+            progress.setdefault('dedup', {'checked': 0, 'duplicates': 0})
     
-    for page_num, image in enumerate(images, 1):
-        print(f"正在处理第 {page_num} 页...")
-        
+    def record_dedup(is_duplicate):
+        dedup_stats['checked'] += 1
+        dedup_stats['duplicates'] += int(is_duplicate)
+        if progress:
+            with _progress_lock:
+                progress['dedup']['checked'] += 1
+                progress['dedup']['duplicates'] += int(is_duplicate)
+    
+    def on_page_done(result, page_num):
+        # 在线程池的完成回调中执行，其中的异常会被静默吞掉；名额释放和进度更新放在finally中，
+        # 否则一次失败就会泄漏 in_flight 名额，主循环在 acquire 处永久阻塞
         try:
-            image_name = f"{os.path.splitext(pdf_filename)[0]}_page_{page_num}.jpg" if images_output_dir else None
-            page_content = analyze_image_with_model(client, image)
+            results[page_num - 1] = result
+            # 比对指纹只在页面完成前保留，完成后或登记到索引或释放
+            fingerprint = page_fingerprints.pop(page_num, None)
+            if page_index is not None and result.get('route') == 'vlm' and 'error' not in result and fingerprint is not None:
+                page_index.add(page_hashes[page_num], fingerprint, result['content'],
+                               {'source_pdf': pdf_filename, 'page_number': page_num})
+            if journal is not None:
+                try:
+                    with journal_lock:
+                        journal.write(json.dumps(result, ensure_ascii=False) + '\n')
+                        journal.flush()
+                except OSError as e:
+                    # 断点日志写入失败（如磁盘已满）只影响断点续传，不影响本页结果
+                    print(f"写入断点日志失败（第 {page_num} 页）: {str(e)}")
+        finally:
+            in_flight.release()
+            if progress:
+                with _progress_lock:
+                    progress['current'] += 1
+    
+    plumber_pdf = None
+    if use_text_layer:
+        try:
+            plumber_pdf = pdfplumber.open(pdf_path)
+        except Exception as e:
+            print(f"无法读取PDF文字层，全部页面改用模型分析: {str(e)}")
+    
+    # 待合并的页面同样占用 in_flight 名额，合并页数不能超过名额总数，否则会互相等待
+    batch_size = max(1, min(batch_size or 1, max_workers + window_size))
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending_batch = []
+            page_features = {}
             
-            result_entry = {
-                "page_number": page_num,
-                "image_name": image_name,
-                "content": page_content,
-                "source_pdf": pdf_filename,
-                "timestamp": str(pd.Timestamp.now())
-            }
+            def submit_batch():
+                if len(pending_batch) == 1:
+                    submit_page(*pending_batch[0])
+                elif pending_batch:
+                    features = {page_num: page_features.pop(page_num, None) for page_num, _ in pending_batch}
+                    future = executor.submit(analyze_page_batch, client, list(pending_batch), pdf_filename,
+                                             images_output_dir, cache, payload_options['image_format'], features)
+                    future.add_done_callback(
+                        lambda f: [on_page_done(result, result['page_number']) for result in f.result()])
+                pending_batch.clear()
             
-            results.append(result_entry)
-        except Exception as e:
-            print(f"处理第 {page_num} 页时出错: {str(e)}")
-            results.append({
-                "page_number": page_num,
-                "image_name": f"{os.path.splitext(pdf_filename)[0]}_page_{page_num}.jpg" if images_output_dir else None,
-                "error": str(e),
-                "source_pdf": pdf_filename,
-                "timestamp": str(pd.Timestamp.now())
-            })
-
-        if progress:
-            progress['current'] += 1
+            def submit_page(page_num, payload):
+                future = executor.submit(analyze_page, client, payload, page_num, pdf_filename, images_output_dir, cache,
+                                         payload_options['image_format'], page_features.pop(page_num, None))
+                # 按完成顺序更新进度，按页码顺序写回结果
+                future.add_done_callback(lambda f, n=page_num: on_page_done(f.result(), n))
+            
+            pages = iter_pdf_pages(pdf_path, images_output_dir, window_size, total_pages, render_workers, payload_options,
+                                   skip_pages=set(completed))
+            for page_num, payload in pages:
+                in_flight.acquire()
+                features, text_content = inspect_page(plumber_pdf, page_num) if plumber_pdf is not None else (None, None)
+                if text_content is not None:
+                    print(f"第 {page_num} 页使用文字层提取")
+                    image_name = page_image_name(pdf_filename, page_num, payload_options['image_format']) if images_output_dir else None
+                    on_page_done(make_page_result(page_num, image_name, pdf_filename, content=text_content,
+                                                  route='text_layer'), page_num)
+                    continue
+                
+                if page_index is not None:
+                    page_hashes[page_num] = perceptual_hash(payload)
+                    page_fingerprints[page_num] = page_fingerprint(payload)
+                    match = page_index.find(page_hashes[page_num], page_fingerprints[page_num])
+                    record_dedup(match is not None)
+                    if match is not None:
+                        content, source = match
+                        print(f"第 {page_num} 页与 {source['source_pdf']} 第 {source['page_number']} 页重复，复用已有描述")
+                        image_name = page_image_name(pdf_filename, page_num, payload_options['image_format']) if images_output_dir else None
+                        result = make_page_result(page_num, image_name, pdf_filename, content=content, route='dedup')
+                        result['duplicate_of'] = source
+                        on_page_done(result, page_num)
+                        continue
+                
+                # 页面特征留给模型分级使用，提交时取出
+                page_features[page_num] = features
+                
+                # 只合并页码连续的低信息密度页面
+                if batch_size > 1 and len(payload) <= PAGE_BATCH_MAX_BYTES:
+                    if pending_batch and pending_batch[-1][0] != page_num - 1:
+                        submit_batch()
+                    pending_batch.append((page_num, payload))
+                    if len(pending_batch) >= batch_size:
+                        submit_batch()
+                    continue
+                
+                submit_batch()
+                submit_page(page_num, payload)
+            submit_batch()
+    finally:
+        if plumber_pdf is not None:
+            plumber_pdf.close()
+        if journal is not None:
+            journal.close()
+    
+    if cache is not None:
+        print(f"页面缓存统计: {cache.stats()}")
+    print(f"连接池使用情况: {get_pool_stats()}")
+    print(f"限流器状态: {get_limiter().stats()}")
+    print(f"页面调用统计: {get_call_policy('page').stats()}")
+    if page_index is not None:
+        print(f"重复页统计: {dedup_stats}")
+    model_usage = {}
+    for result in results:
+        if result and result.get('model'):
+            model_usage[result['model']] = model_usage.get(result['model'], 0) + 1
+    if model_usage:
+        print(f"各模型分析页数: {model_usage}")
     
     # 保存结果
     if output_dir:
-        # 保存JSON文件
-        json_output_path = os.path.join(output_dir, f"{os.path.splitext(pdf_filename)[0]}_extracted.json")
-        with open(json_output_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        
-        print(f"JSON结果已保存至: {json_output_path}")
-        
-        # 转换为Word文档
-        json_to_docx(results, output_dir, pdf_filename)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # 转换为Word文档，与JSON写入同时进行
+            docx_future = executor.submit(json_to_docx, results, output_dir, pdf_filename)
+            
+            # 保存JSON文件
+            json_output_path = os.path.join(output_dir, f"{os.path.splitext(pdf_filename)[0]}_extracted.json")
+            with open(json_output_path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            
+            print(f"JSON结果已保存至: {json_output_path}")
+            
+            # 结果已完整落盘，断点日志不再需要
+            try:
+                os.remove(journal_path)
+            except OSError as e:
+                print(f"删除断点日志失败: {str(e)}")
+            
+            docx_future.result()
     
     return results 
\ No newline at end of file
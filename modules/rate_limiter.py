@@ -0,0 +1,161 @@
+"""
+限流模块
+所有对推理服务的调用共用一个自适应限流器：
+- 令牌桶限制请求速率，平滑多用户同时提交造成的突发流量
+- AIMD并发控制：请求成功时并发上限缓慢增加，遇到429/5xx时成倍收缩
+- 被限流或服务端错误的调用按退避时间自动重试（优先遵循 Retry-After 响应头）
+"""
+import time
+import random
+import threading
+from contextlib import contextmanager
+from openai import APIStatusError, RateLimitError
+
+# 令牌桶配置：平均每秒请求数与允许的突发请求数
+REQUESTS_PER_SECOND = 5.0
+BURST_SIZE = 10
+
+# AIMD并发配置
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+ADDITIVE_INCREASE = 1.0  # 每累计 "当前上限" 次成功请求，上限增加的数量
+MULTIPLICATIVE_DECREASE = 0.5  # 被限流时上限乘以该系数
+DECREASE_COOLDOWN = 2.0  # 两次收缩之间的最小间隔（秒），避免同一波限流被重复计算
+
+# 重试配置
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # 首次重试等待时间（秒），之后按指数增长
+BACKOFF_MAX = 60.0
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def is_throttle_error(error):
+    """判断是否为可重试的限流或服务端错误（429/5xx）"""
+    if isinstance(error, RateLimitError):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+def get_retry_after(error):
+    """读取错误响应中的 Retry-After 秒数，没有时返回None"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """线程安全的令牌桶"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取出一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveLimiter:
+    """令牌桶 + AIMD并发上限的自适应限流器"""
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, burst=BURST_SIZE, initial_concurrency=INITIAL_CONCURRENCY,
+                 min_concurrency=MIN_CONCURRENCY, max_concurrency=MAX_CONCURRENCY):
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self.retries = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """占用一个并发名额并取得令牌，退出时归还名额"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            self.bucket.acquire()
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self):
+        """加性增：每次成功将上限增加 ADDITIVE_INCREASE / 当前上限"""
+        with self._cond:
+            self.successes += 1
+            self.limit = min(self.max_concurrency, self.limit + ADDITIVE_INCREASE / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self):
+        """乘性减：被限流时收缩并发上限"""
+        with self._cond:
+            self.throttled += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= DECREASE_COOLDOWN:
+                self.limit = max(self.min_concurrency, self.limit * MULTIPLICATIVE_DECREASE)
+                self._last_decrease = now
+                print(f"推理服务限流，并发上限降至 {int(self.limit)}")
+
+    def call(self, fn, *args, **kwargs):
+        """在限流器控制下调用 fn，遇到429/5xx时按退避时间自动重试"""
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                with self.slot():
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_throttle_error(e) or attempt >= MAX_RETRIES:
+                    raise
+                self.on_throttle()
+                wait = get_retry_after(e)
+                if wait is None:
+                    wait = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                with self._cond:
+                    self.retries += 1
+                print(f"请求被限流或服务端出错({getattr(e, 'status_code', '')})，{wait:.1f} 秒后第 {attempt + 1} 次重试")
+                time.sleep(wait)
+                continue
+            self.on_success()
+            return result
+
+    def stats(self):
+        """返回限流器当前状态"""
+        with self._cond:
+            return {
+                'concurrency_limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'successes': self.successes,
+                'throttled': self.throttled,
+                'retries': self.retries,
+            }
+
+def get_limiter():
+    """获取进程内共享的限流器（首次使用时创建）"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            # 显式传入当前配置，运行时修改的模块配置在创建时生效
+            _limiter = AdaptiveLimiter(REQUESTS_PER_SECOND, BURST_SIZE, INITIAL_CONCURRENCY,
+                                       MIN_CONCURRENCY, MAX_CONCURRENCY)
+        return _limiter
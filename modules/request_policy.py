@@ -0,0 +1,175 @@
+"""
+调用策略模块
+为PDF页面分析和文档解读的推理调用统一提供尾延迟控制：
+- 每次调用设置超时时间，挂起的请求不会拖住整个任务
+- 超时或连接失败的调用按指数退避重试（429/5xx的重试仍由 rate_limiter 负责）
+- 可选的对冲请求：调用耗时超过近期p95延迟仍未返回时，再发送一个相同的请求，采用先完成的结果
+  （延迟只统计实际请求耗时，不含在限流器中排队和被限流退避的时间）
+"""
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
+from openai import APIConnectionError
+from modules.rate_limiter import get_limiter
+
+# 各类调用的策略：timeout 为单次请求超时（秒，流式调用中为两段数据之间的最长等待），
+# max_attempts 为最多尝试次数，hedge 表示是否启用对冲请求
+CALL_POLICIES = {
+    'page': {'timeout': 120, 'max_attempts': 3, 'hedge': True},
+    'page_batch': {'timeout': 300, 'max_attempts': 2, 'hedge': False},
+    'summary': {'timeout': 300, 'max_attempts': 2, 'hedge': False},
+    'summary_chunk': {'timeout': 180, 'max_attempts': 3, 'hedge': False},
+}
+
+# 超时重试的退避时间（秒），按指数增长
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 30.0
+
+# 对冲配置：按最近 LATENCY_WINDOW 次成功调用的 HEDGE_QUANTILE 分位延迟触发对冲，
+# 样本少于 HEDGE_MIN_SAMPLES 时不对冲；对冲请求数不超过调用总数的 HEDGE_MAX_RATIO，避免放大服务端压力
+LATENCY_WINDOW = 200
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_RATIO = 0.1
+# 执行对冲调用的线程数
+HEDGE_WORKERS = 32
+
+_policies = {}
+_policies_lock = threading.Lock()
+_hedge_executor = None
+
+class HedgeCancelled(Exception):
+    """对冲调用在获得限流名额前另一个请求已经成功，不再发送"""
+
+def is_retryable_error(error):
+    """判断是否为可重试的超时或连接错误；流式读取中途超时或断开时SDK抛出的是原始的httpx异常"""
+    return isinstance(error, (APIConnectionError, httpx.TimeoutException, httpx.TransportError))
+
+def get_hedge_executor():
+    """获取执行对冲调用的共享线程池（首次使用时创建）"""
+    global _hedge_executor
+    with _policies_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedge')
+        return _hedge_executor
+
+class CallPolicy:
+    """单类调用的超时、重试与对冲策略，记录近期延迟用于计算对冲阈值"""
+
+    def __init__(self, name, timeout, max_attempts=1, hedge=False):
+        self.name = name
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.hedge = hedge
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def hedge_delay(self):
+        """返回触发对冲的等待时间，样本不足或对冲次数已达上限时返回None"""
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES or self.hedges >= self.calls * HEDGE_MAX_RATIO:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * HEDGE_QUANTILE))]
+
+    def _timed_call(self, fn, args, kwargs, started=None, cancelled=None):
+        """经共享限流器执行一次调用，只统计获得名额后实际请求的耗时
+
+        started 在获得名额、开始请求时置位；cancelled 已置位时不再发送请求。
+        """
+        def timed_fn(*fn_args, **fn_kwargs):
+            if cancelled is not None and cancelled.is_set():
+                raise HedgeCancelled()
+            if started is not None:
+                started.set()
+            start = time.monotonic()
+            result = fn(*fn_args, **fn_kwargs)
+            with self._lock:
+                self._latencies.append(time.monotonic() - start)
+            return result
+        return get_limiter().call(timed_fn, *args, timeout=self.timeout, **kwargs)
+
+    def _hedged_call(self, fn, args, kwargs):
+        """发送主请求，超过对冲阈值仍未返回时再发送一个相同请求，返回先成功的结果"""
+        delay = self.hedge_delay() if self.hedge else None
+        if delay is None:
+            return self._timed_call(fn, args, kwargs)
+
+        executor = get_hedge_executor()
+        started = threading.Event()
+        cancelled = threading.Event()
+        primary = executor.submit(self._timed_call, fn, args, kwargs, started)
+        # 主请求仍在限流器中排队时不开始计时，避免限流期间把排队误判为慢请求而加发对冲
+        primary.add_done_callback(lambda f: started.set())
+        started.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            self.hedges += 1
+        print(f"{self.name} 调用超过 {delay:.1f} 秒未返回，发送对冲请求")
+        hedge = executor.submit(self._timed_call, fn, args, kwargs, None, cancelled)
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return future.result()
+                    if not isinstance(future.exception(), HedgeCancelled):
+                        error = future.exception()
+            raise error
+        finally:
+            # 仍在排队的对冲请求直接放弃；已发出的请求无法中途取消，会在超时内自行结束，结果被丢弃
+            cancelled.set()
+            hedge.cancel()
+
+    def call(self, fn, *args, **kwargs):
+        """按策略调用 fn（需接受 timeout 关键字参数），超时或连接失败时退避重试"""
+        with self._lock:
+            self.calls += 1
+        for attempt in range(self.max_attempts):
+            try:
+                return self._hedged_call(fn, args, kwargs)
+            except Exception as e:
+                if not is_retryable_error(e) or attempt + 1 >= self.max_attempts:
+                    raise
+                wait_time = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                with self._lock:
+                    self.retries += 1
+                print(f"{self.name} 调用超时或连接失败({type(e).__name__})，{wait_time:.1f} 秒后第 {attempt + 1} 次重试")
+                time.sleep(wait_time)
+
+    def stats(self):
+        """返回调用次数、重试与对冲统计以及近期延迟分位数"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'calls': self.calls,
+                'retries': self.retries,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+            }
+        if latencies:
+            stats['p50'] = round(latencies[len(latencies) // 2], 2)
+            stats['p95'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2)
+        return stats
+
+def get_call_policy(name):
+    """获取进程内共享的调用策略（首次使用时按 CALL_POLICIES 中的配置创建）"""
+    with _policies_lock:
+        if name not in _policies:
+            _policies[name] = CallPolicy(name, **CALL_POLICIES[name])
+        return _policies[name]
@@ -0,0 +1,149 @@
+"""
+结果缓存模块
+基于SQLite的内容寻址磁盘缓存，用于复用模型调用结果：
+- 缓存键由内容哈希、模型ID、提示词等组成，内容不变即可命中
+- 按缓存总大小执行LRU淘汰，可选按写入时间过期（TTL）
+- 记录命中/未命中次数
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+# 默认缓存目录，与 app.py 中的文件存储区保持一致
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '文件存储区', '缓存')
+
+def file_sha256(file_path):
+    """分块计算文件的SHA-256，不把整个文件读入内存"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_cache_key(*parts):
+    """将若干内容片段（bytes或str）组合计算为SHA-256缓存键"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        # 写入长度前缀，避免不同切分方式拼接出相同的输入
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+def cache_get(cache, key):
+    """读取缓存，缓存为None时直接未命中；缓存出错（如多进程部署时数据库被锁）时记录日志并按未命中处理"""
+    if cache is None:
+        return None
+    try:
+        return cache.get(key)
+    except Exception as e:
+        print(f"读取结果缓存失败，按未命中处理: {str(e)}")
+        return None
+
+def cache_set(cache, key, value):
+    """写入缓存，写入失败（如磁盘已满、数据库被锁）只记录日志，不影响已得到的结果"""
+    if cache is None:
+        return
+    try:
+        cache.set(key, value)
+    except Exception as e:
+        print(f"写入结果缓存失败: {str(e)}")
+
+class ResultCache:
+    """按总大小做LRU淘汰的SQLite缓存，可被多个线程共享；指定 ttl（秒）时条目写入超过该时间后失效"""
+
+    def __init__(self, db_path, max_bytes=512 * 1024 * 1024, ttl=None):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL, created REAL)"
+        )
+        # 兼容没有写入时间列的旧缓存文件
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(cache)")]
+        if 'created' not in columns:
+            self._conn.execute("ALTER TABLE cache ADD COLUMN created REAL")
+            self._conn.execute("UPDATE cache SET created = last_access")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def get(self, key):
+        """读取缓存值，命中时刷新访问时间；未命中返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT value, size, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and time.time() - (row[2] or 0) > self.ttl:
+                # 已过期的条目直接删除
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._total_bytes -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        """写入缓存值，超出容量时按最近最少使用顺序淘汰旧条目"""
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+            if old:
+                self._total_bytes -= old[0]
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, last_access, created) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._total_bytes += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """先清除过期条目，再淘汰最久未访问的条目，直到总大小不超过上限（调用方需持有锁）"""
+        if self.ttl is not None:
+            expired_before = time.time() - self.ttl
+            expired_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache WHERE created < ?", (expired_before,)
+            ).fetchone()[0]
+            if expired_bytes:
+                self._conn.execute("DELETE FROM cache WHERE created < ?", (expired_before,))
+                self._total_bytes -= expired_bytes
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM cache ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def stats(self):
+        """返回命中统计与当前占用"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': entries,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
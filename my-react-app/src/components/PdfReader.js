@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './PdfReader.css';
 import { API_BASE_URL } from '../config';
 
@@ -19,6 +19,46 @@ function PdfReader() {
     const [parsedFiles, setParsedFiles] = useState([]);
     const [previewFile, setPreviewFile] = useState(null);
     const [isPreviewOpen, setIsPreviewOpen] = useState(false);
+    const [reasoningMode, setReasoningMode] = useState('auto');
+    const [liveThinking, setLiveThinking] = useState('');
+    const [liveAnswer, setLiveAnswer] = useState('');
+    const eventSourceRef = useRef(null);
+
+    // 关闭解读输出的SSE连接
+    const closeLiveStream = () => {
+        if (eventSourceRef.current) {
+            eventSourceRef.current.close();
+            eventSourceRef.current = null;
+        }
+    };
+
+    // 订阅解读输出的SSE流，实时显示模型的思考过程和解读内容
+    const openLiveStream = () => {
+        closeLiveStream();
+        setLiveThinking('');
+        setLiveAnswer('');
+        const eventSource = new EventSource(`${API_BASE_URL}/api/pdf-reader/stream`);
+        eventSource.addEventListener('thinking', (event) => {
+            const { text } = JSON.parse(event.data);
+            setLiveThinking(prev => prev + text);
+        });
+        eventSource.addEventListener('answer', (event) => {
+            const { text } = JSON.parse(event.data);
+            setLiveAnswer(prev => prev + text);
+        });
+        // 请求被重试时服务端会重新输出，丢弃已显示的内容
+        eventSource.addEventListener('reset', () => {
+            setLiveThinking('');
+            setLiveAnswer('');
+        });
+        eventSource.addEventListener('done', () => {
+            closeLiveStream();
+        });
+        eventSourceRef.current = eventSource;
+    };
+
+    // 组件卸载时关闭SSE连接
+    useEffect(() => closeLiveStream, []);
 
     // 页面加载时获取已处理的文件列表和当前处理状态
     useEffect(() => {
@@ -157,6 +197,7 @@ function PdfReader() {
 
         const formData = new FormData();
         formData.append('file', files[0]);
+        formData.append('reasoning', reasoningMode);
 
         try {
             setIsUploading(true);
@@ -184,6 +225,7 @@ function PdfReader() {
 
             const data = await response.json();
             console.log('上传成功:', data);
+            openLiveStream();
         } catch (error) {
             console.error('上传出错:', error);
             alert(`上传出错，请重试。错误信息: ${error.message}`);
@@ -207,6 +249,7 @@ function PdfReader() {
                 throw new Error('取消处理失败');
             }
             
+            closeLiveStream();
             setIsUploading(false);
             setIsCompleted(false);
             setProgress(0);
@@ -327,6 +370,19 @@ function PdfReader() {
                         <span className="file-name">已选择: {selectedFileName}</span>
                     </div>
                 )}
+                <div className="reasoning-select">
+                    <label htmlFor="reasoning-mode">思考模式：</label>
+                    <select
+                        id="reasoning-mode"
+                        value={reasoningMode}
+                        onChange={(e) => setReasoningMode(e.target.value)}
+                        disabled={isUploading}
+                    >
+                        <option value="auto">自动（按文档长度和类型）</option>
+                        <option value="off">快速（不思考）</option>
+                        <option value="on">深度思考</option>
+                    </select>
+                </div>
                 <button
                     onClick={isUploading ? handleCancel : handleUpload}
                     style={{
@@ -352,6 +408,12 @@ function PdfReader() {
                 <div className="progress-section">
                     <p className="status-text">状态: {detailedProgress.status}</p>
                     <p className="status-text">当前文件: {detailedProgress.currentFile}</p>
+                    {liveThinking && !liveAnswer && (
+                        <pre className="live-output live-thinking">{liveThinking}</pre>
+                    )}
+                    {liveAnswer && (
+                        <pre className="live-output">{liveAnswer}</pre>
+                    )}
                 </div>
             )}
 